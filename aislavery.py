@@ -59,7 +59,7 @@ def get_credentials():
 
 def get_sheets_service():
     creds = get_credentials()
-    service = build('sheets', 'v4', credentials=creds)
+    service = build('sheets', 'v4', credentials=creds, cache_discovery=False, static_discovery=True)
     return service
 
 # Global variables
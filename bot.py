@@ -103,12 +103,12 @@ def get_credentials():
 
 def get_sheets_service():
     creds = get_credentials()
-    service = build('sheets', 'v4', credentials=creds)
+    service = build('sheets', 'v4', credentials=creds, cache_discovery=False, static_discovery=True)
     return service
 
 def get_calendar_service():
     creds = get_credentials()
-    service = build('calendar', 'v3', credentials=creds)
+    service = build('calendar', 'v3', credentials=creds, cache_discovery=False, static_discovery=True)
     return service
 
 # Global variables
@@ -938,11 +938,12 @@ async def handle_habit_response(update: Update, context: ContextTypes.DEFAULT_TY
         return
 
     try:
-        # Get sheet data
+        # Read only the Event ID column to locate the habit row
         sheets_service = get_sheets_service()
         result = sheets_service.spreadsheets().values().get(
             spreadsheetId=SPREADSHEET_ID,
-            range='Habits!A:E'
+            range='Habits!E:E',
+            majorDimension='COLUMNS'
         ).execute()
         values = result.get('values', [])
 
@@ -950,19 +951,10 @@ async def handle_habit_response(update: Update, context: ContextTypes.DEFAULT_TY
             await query.edit_message_text("❌ No habits found in sheet.")
             return
 
-        # Find the habit row
-        headers = values[0]
-        row_number = None
-        habit_description = None
-
-        for idx, row in enumerate(values[1:], start=2):
-            row_dict = dict(zip(headers, row))
-            if row_dict.get('Event ID') == event_id:
-                row_number = idx
-                habit_description = row_dict.get('Habit Description')
-                break
-
-        if not row_number:
+        # The column includes the header row, so list index + 1 is the sheet row
+        try:
+            row_number = values[0].index(event_id) + 1
+        except ValueError:
             await query.edit_message_text("❌ Habit not found in records.")
             return
 
@@ -975,6 +967,13 @@ async def handle_habit_response(update: Update, context: ContextTypes.DEFAULT_TY
             body={'values': [[new_status]]}
         ).execute()
 
+        # Fetch the habit description for the confirmation message
+        result = sheets_service.spreadsheets().values().get(
+            spreadsheetId=SPREADSHEET_ID,
+            range=f'Habits!A{row_number}'
+        ).execute()
+        habit_description = result.get('values', [['']])[0][0]
+
         # Confirm update
         emoji = "✅" if new_status == "Done" else "❌"
         await query.edit_message_text(
@@ -1012,6 +1011,27 @@ async def habit_check(update: Update, context: ContextTypes.DEFAULT_TYPE):
     for habit in todays_habits:
         await send_habit_check(habit['Habit Description'], habit['Event ID'])
 
+# Map callback_data prefixes (the part before '|') to their handlers
+CALLBACK_DISPATCH = {
+    'event_done': handle_event_response,
+    'event_missed': handle_event_response,
+    'task_done': handle_task_response,
+    'task_not_done': handle_task_response,
+    'habit_done': handle_habit_response,
+    'habit_missed': handle_habit_response,
+}
+
+# Callback handler that routes every button press
+async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Dispatch a callback query to its handler with a single dict lookup."""
+    query = update.callback_query
+    handler = CALLBACK_DISPATCH.get(query.data.split('|', 1)[0])
+    if not handler:
+        await query.answer()
+        await query.edit_message_text("❌ Invalid response.")
+        return
+    await handler(update, context)
+
 # Register all handlers
 def register_handlers(app):
     # Command handlers
@@ -1038,10 +1058,8 @@ def register_handlers(app):
     )
     app.add_handler(conv_handler)
 
-    # Callback query handlers
-    app.add_handler(CallbackQueryHandler(handle_event_response, pattern='^event_'))
-    app.add_handler(CallbackQueryHandler(handle_task_response, pattern='^task_'))
-    app.add_handler(CallbackQueryHandler(handle_habit_response, pattern='^habit_'))
+    # Callback query handler (routes by prefix via CALLBACK_DISPATCH)
+    app.add_handler(CallbackQueryHandler(handle_callback_query))
 
     # Error handler
     app.add_error_handler(error_handler)
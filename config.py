@@ -1,61 +1,138 @@
 # config.py
 
 import os
+import re
+import asyncio
+import threading
+import httplib2
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 import logging
 
+# Cheap check for anything dateparser could turn into a date, shared by the event and task bots
+DATE_HINT_RE = re.compile(
+    r'\d|\b(?:today|tonight|tomorrow|yesterday|noon|midnight|morning|afternoon|evening|'
+    r'next|this|last|ago|later|weekends?|weeks?|months?|years?|days?|hours?|minutes?|'
+    r"am|pm|[ap]\.m|o'?clock|one|two|three|four|five|six|seven|eight|nine|ten|eleven|twelve|"
+    r'(?:mon|tue|wed|thu|fri|sat|sun|jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*)\b',
+    re.IGNORECASE
+)
+
 # Define the scopes for Google APIs
 SCOPES = [
     'https://www.googleapis.com/auth/calendar.events',
     'https://www.googleapis.com/auth/spreadsheets'
 ]
 
+# Credentials are loaded once and shared by every thread; the lock keeps worker
+# threads from refreshing them or rewriting token.json at the same time
+CREDENTIALS = None
+CREDENTIALS_LOCK = threading.Lock()
+
 def get_credentials():
     """Get and refresh Google OAuth2 credentials."""
-    creds = None
-    if os.path.exists('token.json'):
-        try:
-            creds = Credentials.from_authorized_user_file('token.json', SCOPES)
-            logging.info("Loaded existing credentials from token.json")
-        except Exception as e:
-            logging.error(f"Error loading token.json: {e}")
-            os.remove('token.json')
-            logging.info("Removed invalid token.json")
-
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            logging.info("Refreshing expired credentials")
+    global CREDENTIALS
+    creds = CREDENTIALS
+    if creds and creds.valid:
+        return creds
+
+    with CREDENTIALS_LOCK:
+        creds = CREDENTIALS
+        if creds and creds.valid:
+            return creds  # Another thread refreshed them while we waited
+
+        if not creds and os.path.exists('token.json'):
+            try:
+                creds = Credentials.from_authorized_user_file('token.json', SCOPES)
+                logging.info("Loaded existing credentials from token.json")
+            except Exception as e:
+                logging.error(f"Error loading token.json: {e}")
+                os.remove('token.json')
+                logging.info("Removed invalid token.json")
+
+        if not creds or not creds.valid:
+            previous_token = creds.token if creds else None
+            if creds and creds.expired and creds.refresh_token:
+                logging.info("Refreshing expired credentials")
+                creds.refresh(Request())
+            else:
+                if not os.path.exists('credentials.json'):
+                    raise FileNotFoundError("credentials.json not found")
+
+                logging.info("Initiating new OAuth flow")
+                flow = InstalledAppFlow.from_client_secrets_file(
+                    'credentials.json',
+                    SCOPES
+                )
+                creds = flow.run_local_server(
+                    port=0,
+                    access_type='offline',
+                    prompt='consent'
+                )
+
+            # Only rewrite token.json when the token actually changed
+            if creds.token != previous_token:
+                logging.info("Saving new credentials to token.json")
+                with open('token.json', 'w') as token:
+                    token.write(creds.to_json())
+
+        CREDENTIALS = creds
+        return creds
+
+# httplib2 connections are not thread-safe, so each thread keeps one
+# keep-alive connection that every service build reuses
+_thread_local = threading.local()
+
+def _get_http():
+    """Return the calling thread's shared httplib2 connection."""
+    http = getattr(_thread_local, 'http', None)
+    if http is None:
+        http = _thread_local.http = httplib2.Http(timeout=30)
+    return http
+
+def _refresh_credentials(stale_token):
+    """Refresh CREDENTIALS under the lock unless another thread already replaced stale_token."""
+    with CREDENTIALS_LOCK:
+        creds = CREDENTIALS
+        if creds.token == stale_token:
+            logging.info("Refreshing credentials rejected by the API")
             creds.refresh(Request())
-        else:
-            if not os.path.exists('credentials.json'):
-                raise FileNotFoundError("credentials.json not found")
-
-            logging.info("Initiating new OAuth flow")
-            flow = InstalledAppFlow.from_client_secrets_file(
-                'credentials.json',
-                SCOPES
-            )
-            creds = flow.run_local_server(
-                port=0,
-                access_type='offline',
-                prompt='consent'
-            )
-
-        logging.info("Saving new credentials to token.json")
-        with open('token.json', 'w') as token:
-            token.write(creds.to_json())
-
-    return creds
+            with open('token.json', 'w') as token:
+                token.write(creds.to_json())
+
+def _get_authorized_http():
+    """Return the calling thread's authorized connection, built on the shared credentials."""
+    http = getattr(_thread_local, 'authorized_http', None)
+    if http is None:
+        # No 401 refresh here: it would bypass CREDENTIALS_LOCK, so _execute handles it
+        http = _thread_local.authorized_http = AuthorizedHttp(
+            get_credentials(), http=_get_http(), refresh_status_codes=()
+        )
+    return http
 
 def get_sheets_service():
-    creds = get_credentials()
-    service = build('sheets', 'v4', credentials=creds)
+    service = build('sheets', 'v4', http=_get_authorized_http(), cache_discovery=False, static_discovery=True)
     return service
 
 def get_calendar_service():
-    creds = get_credentials()
-    service = build('calendar', 'v3', credentials=creds)
+    service = build('calendar', 'v3', http=_get_authorized_http(), cache_discovery=False, static_discovery=True)
     return service
+
+def _execute(request):
+    """Execute a request on the calling thread's connection, refreshing the shared credentials under the lock."""
+    token = get_credentials().token
+    try:
+        return request.execute(http=_get_authorized_http())
+    except HttpError as e:
+        if e.resp.status != 401:
+            raise
+        _refresh_credentials(token)
+        return request.execute(http=_get_authorized_http())
+
+async def execute_async(request):
+    """Run a blocking googleapiclient request in a worker thread."""
+    return await asyncio.to_thread(_execute, request)
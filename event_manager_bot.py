@@ -1,6 +1,7 @@
 # event_manager_bot.py
 
 import os
+import asyncio
 from dotenv import load_dotenv
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
@@ -13,14 +14,13 @@ from telegram.ext import (
     MessageHandler,
     filters,
 )
-import dateparser
-from dateparser.search import search_dates
 from datetime import datetime, timedelta
 import pytz
 import re
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.date import DateTrigger
-from config import get_sheets_service, get_calendar_service, SCOPES
+import time
+from collections import namedtuple
+from functools import lru_cache
+from config import get_sheets_service, get_calendar_service, execute_async, SCOPES, DATE_HINT_RE
 
 # Load environment variables from .env file
 load_dotenv()
@@ -42,13 +42,66 @@ if not TOKEN:
 if not SPREADSHEET_ID:
     raise ValueError("No spreadsheet ID provided. Set the SPREADSHEET_ID environment variable.")
 
-# Initialize APScheduler
-scheduler = AsyncIOScheduler(timezone='Asia/Kuala_Lumpur')
-scheduler.start()
+# Local timezone (replace with your timezone if different)
+LOCAL_TZ_STR = 'Asia/Kuala_Lumpur'
+LOCAL_TZ = pytz.timezone(LOCAL_TZ_STR)
+
+# Pending event lifecycles (event_id -> asyncio.Task), cancelled once the user responds
+EVENT_TASKS = {}
+AUTO_UPDATE_DELAY = 3600  # seconds to wait for a response before marking an event missed
 
 # Define states for ConversationHandler
 CONFIRMATION = 1
 
+# Google API clients are built once and shared by every handler
+@lru_cache(maxsize=1)
+def cached_sheets_service():
+    return get_sheets_service()
+
+@lru_cache(maxsize=1)
+def cached_calendar_service():
+    return get_calendar_service()
+
+# Column positions in the Events sheet
+COL_DESCRIPTION = 0
+COL_STATUS = 1
+COL_EVENT_ID = 4
+
+# Short-lived cache of the Events sheet as {event_id: (row_number, row)}
+EVENTS_INDEX_TTL = 30  # seconds
+EVENTS_INDEX_CACHE = {'ts': 0.0, 'index': None}
+
+# Row numbers of events created by this process, taken from the append response
+EVENT_ROWS = {}
+UPDATED_RANGE_RE = re.compile(r'![A-Z]+(\d+)')
+
+# Result of parsing a natural language event (hashable, so it can be cached)
+ParsedEvent = namedtuple('ParsedEvent', ['description', 'datetime', 'duration', 'ambiguous'])
+
+# Precompiled regex patterns for event parsing
+# One alternation covers "for/lasting/in N unit" and "N unit [long|duration]"
+DURATION_RE = re.compile(
+    r'(?:\b(?P<prefix>for|lasting|in)\s+)?(?P<num>\d+(?:\.\d+)?)\s*'
+    r'(?P<unit>hours?|hrs?|h|minutes?|mins?|m)\b(?:\s*(?:long|duration)\b)?',
+    re.IGNORECASE
+)
+# Minutes per duration unit, covering every spelling DURATION_RE accepts
+UNIT_MINUTES = {
+    'h': 60, 'hr': 60, 'hrs': 60, 'hour': 60, 'hours': 60,
+    'm': 1, 'min': 1, 'mins': 1, 'minute': 1, 'minutes': 1,
+}
+NOW_RES = [re.compile(p, re.IGNORECASE) for p in [r'\bnow\b', r'\bright now\b', r'\bimmediately\b']]
+STRUCTURED_RE = re.compile(r'^(.+?)\s*\|\s*(.+?)\s*\|\s*(\d+)\s*$', re.IGNORECASE)
+ISO_DT_RE = re.compile(r'^(\d{4})-(\d{2})-(\d{2})[ T](\d{2}):(\d{2})$')
+
+# Shared dateparser settings; only the parsers this bot needs are enabled
+DATEPARSER_SETTINGS = {
+    'PREFER_DATES_FROM': 'future',
+    'PARSERS': ['absolute-time', 'relative-time'],
+}
+WS_RE = re.compile(r'\s+')
+KEYWORD_RE = re.compile(r'\b(set|schedule)\b', re.IGNORECASE)
+
 # Command: /start
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Store user's chat ID and send welcome message."""
@@ -69,28 +122,10 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/eventtoday - View today's events\n"
     )
 
-# Function to extract duration from text
-def extract_duration(text):
-    """Extract duration in minutes from text."""
-    duration_patterns = [
-        r'for (\d+(?:\.\d+)?)\s*(hours?|hrs?|h|minutes?|mins?|m)',
-        r'(\d+(?:\.\d+)?)\s*(hours?|hrs?|h|minutes?|mins?|m)\s*(long|duration)?',
-        r'lasting (\d+(?:\.\d+)?)\s*(hours?|hrs?|h|minutes?|mins?|m)',
-    ]
-
-    for pattern in duration_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            num = float(match.group(1))
-            unit = match.group(2).lower()
-
-            # Convert to minutes
-            if unit.startswith(('hour', 'hr', 'h')):
-                return int(num * 60)
-            elif unit.startswith(('min', 'm')):
-                return int(num)
-
-    return 60  # Default duration in minutes
+# Function to convert a DURATION_RE match to minutes
+def duration_minutes_from(match):
+    """Return the duration of a DURATION_RE match in minutes."""
+    return int(float(match.group('num')) * UNIT_MINUTES[match.group('unit').lower()])
 
 # Error handler
 async def error_handler(update, context):
@@ -103,44 +138,49 @@ async def error_handler(update, context):
 def parse_natural_language(text):
     """
     Parse natural language input for event details.
-    Returns: (event_description, event_datetime, duration_minutes, ambiguous)
+    Returns: ParsedEvent(description, datetime, duration, ambiguous)
     """
-    duration_minutes = 60  # Default duration
+    # Results are cached per minute, so retrying the same phrase is a dict lookup
+    now = datetime.now().replace(second=0, microsecond=0)
+    return parse_natural_language_at(text, now)
+
+@lru_cache(maxsize=1024)
+def parse_natural_language_at(text, now):
+    """Parse event details relative to `now`; memoized on (text, now)."""
     ambiguous = False
-    now = datetime.now()
-
-    # First extract duration to prevent interference with date parsing
-    extracted_duration = extract_duration(text)
-    if extracted_duration:
-        duration_minutes = extracted_duration
-        logger.debug(f"Extracted duration: {duration_minutes} minutes")
-
-    # Remove duration phrases from text before date parsing
-    duration_patterns = [
-        r'for \d+(?:\.\d+)?\s*(hours?|hrs?|minutes?|mins?)',
-        r'in \d+(?:\.\d+)?\s*(hours?|hrs?|minutes?|mins?)',
-        r'lasting \d+(?:\.\d+)?\s*(hours?|hrs?|minutes?|mins?)',
-        r'\d+(?:\.\d+)?\s*(hours?|hrs?|minutes?|mins?|m)\s*(long|duration)?'
-    ]
-    text_cleaned = text
-    for pattern in duration_patterns:
-        text_cleaned = re.sub(pattern, '', text_cleaned, flags=re.IGNORECASE)
-        logger.debug(f"Text after removing duration pattern '{pattern}': '{text_cleaned}'")
+
+    # Remove duration phrases before date parsing, collecting (prefix, minutes) for each
+    durations = []
+
+    def take_duration(match):
+        durations.append(((match.group('prefix') or '').lower(), duration_minutes_from(match)))
+        return ''
+
+    text_cleaned = DURATION_RE.sub(take_duration, text)
+    # A "for"/"lasting" phrase wins over bare or "in N unit" ones, so "in 2 hours for 30 minutes" lasts 30
+    explicit = [minutes for prefix, minutes in durations if prefix in ('for', 'lasting')]
+    duration_minutes = (explicit or [minutes for _, minutes in durations] or [60])[0]  # Default duration
+    logger.debug(f"Duration: {duration_minutes} minutes; text after removing duration phrases: '{text_cleaned}'")
 
     # Check for "now" explicitly
-    now_patterns = [r'\bnow\b', r'\bright now\b', r'\bimmediately\b']
-    is_now = any(re.search(pattern, text_cleaned, re.IGNORECASE) for pattern in now_patterns)
+    is_now = any(pattern.search(text_cleaned) for pattern in NOW_RES)
 
     if is_now:
         # Remove "now" related words from text
-        for pattern in now_patterns:
-            text_cleaned = re.sub(pattern, '', text_cleaned, flags=re.IGNORECASE)
-            logger.debug(f"Text after removing 'now' pattern '{pattern}': '{text_cleaned}'")
+        for pattern in NOW_RES:
+            text_cleaned = pattern.sub('', text_cleaned)
+            logger.debug(f"Text after removing 'now' pattern '{pattern.pattern}': '{text_cleaned}'")
+        event_datetime = now
+    elif not DATE_HINT_RE.search(text_cleaned):
+        # Nothing that looks like a date, so skip dateparser entirely
         event_datetime = now
+        ambiguous = True
+        logger.debug("No date-like words found; defaulting to current time and marking as ambiguous.")
     else:
-        # Extract dates and times for non-"now" cases
+        # Extract dates and times for non-"now" cases (dateparser is slow to import, so load it on first use)
+        from dateparser.search import search_dates
         date_times = search_dates(text_cleaned, languages=['en'], settings={
-            'PREFER_DATES_FROM': 'future',
+            **DATEPARSER_SETTINGS,
             'RELATIVE_BASE': now
         })
         logger.debug(f"Date times found: {date_times}")
@@ -158,8 +198,10 @@ def parse_natural_language(text):
                 dt_text, event_datetime = date_times[0]
                 ambiguous = True  # All dates are in the past
                 logger.debug(f"All dates are in the past; selected date: '{dt_text}' -> {event_datetime}")
-            # Remove the date/time text
-            text_cleaned = re.sub(re.escape(dt_text), '', text_cleaned, flags=re.IGNORECASE)
+            # Remove the date/time text (case-insensitive literal match)
+            idx = text_cleaned.lower().find(dt_text.lower())
+            if idx >= 0:
+                text_cleaned = text_cleaned[:idx] + text_cleaned[idx + len(dt_text):]
             logger.debug(f"Text after removing date/time '{dt_text}': '{text_cleaned}'")
         else:
             event_datetime = now  # Default to now if no date/time found
@@ -167,12 +209,12 @@ def parse_natural_language(text):
             logger.debug("No date/time found; defaulting to current time and marking as ambiguous.")
 
     # Clean up the event description
-    event_description = re.sub(r'\s+', ' ', text_cleaned).strip().strip('.,')
+    event_description = WS_RE.sub(' ', text_cleaned).strip().strip('.,')
     logger.debug(f"Event description after cleanup: '{event_description}'")
 
     # Additional cleanup for common artifacts
-    event_description = re.sub(r'\b(set|schedule)\b', '', event_description, flags=re.IGNORECASE)
-    event_description = re.sub(r'\s+', ' ', event_description).strip()
+    event_description = KEYWORD_RE.sub('', event_description)
+    event_description = WS_RE.sub(' ', event_description).strip()
     logger.debug(f"Event description after additional cleanup: '{event_description}'")
 
     # Mark as ambiguous if description is too short
@@ -182,63 +224,79 @@ def parse_natural_language(text):
 
     logger.debug(f"Parsed event: '{event_description}' at {event_datetime} for {duration_minutes} minutes (ambiguous: {ambiguous})")
 
-    return event_description, event_datetime, duration_minutes, ambiguous
+    return ParsedEvent(event_description, event_datetime, duration_minutes, ambiguous)
+
+# Function to parse the date and time of a structured /setevent
+def parse_event_datetime(text):
+    """Parse 'YYYY-MM-DD HH:MM' directly; fall back to dateparser for anything else."""
+    match = ISO_DT_RE.match(text)
+    if match:
+        try:
+            return datetime(*map(int, match.groups()))
+        except ValueError:
+            return None  # Right shape but not a real date/time
+    import dateparser
+    return dateparser.parse(text, languages=['en'])
 
 # Function to create an event
 async def create_event(update, context, event_description, event_datetime, duration_minutes):
     """Create an event and schedule its completion check."""
     # Localize datetime
-    local_tz = pytz.timezone('Asia/Kuala_Lumpur')  # Replace with your timezone
-    event_datetime = local_tz.localize(event_datetime)
+    event_datetime = LOCAL_TZ.localize(event_datetime)
+    end_datetime = event_datetime + timedelta(minutes=duration_minutes)
+    event_date_str, event_time_str = f"{event_datetime:%Y-%m-%d}", f"{event_datetime:%H:%M}"
 
     try:
         # Create Google Calendar event
-        service = get_calendar_service()
+        service = cached_calendar_service()
         event = {
             'summary': event_description,
             'start': {
                 'dateTime': event_datetime.isoformat(),
-                'timeZone': str(local_tz),
+                'timeZone': LOCAL_TZ_STR,
             },
             'end': {
-                'dateTime': (event_datetime + timedelta(minutes=duration_minutes)).isoformat(),
-                'timeZone': str(local_tz),
+                'dateTime': end_datetime.isoformat(),
+                'timeZone': LOCAL_TZ_STR,
             },
         }
-        created_event = service.events().insert(calendarId='primary', body=event).execute()
+        created_event = await execute_async(service.events().insert(calendarId='primary', body=event))
         event_id = created_event.get('id')
 
         # Log the event in Google Sheets
-        sheets_service = get_sheets_service()
+        sheets_service = cached_sheets_service()
         values = [[
             event_description,
             'Pending',
-            event_datetime.strftime('%Y-%m-%d'),
-            event_datetime.strftime('%H:%M'),
+            event_date_str,
+            event_time_str,
             event_id
         ]]
 
-        sheets_service.spreadsheets().values().append(
+        # Log to Sheets first, so a failed append never leaves a lifecycle task or a success message behind
+        append_result = await execute_async(sheets_service.spreadsheets().values().append(
             spreadsheetId=SPREADSHEET_ID,
             range='Events!A:E',
             valueInputOption='RAW',
+            insertDataOption='INSERT_ROWS',
+            includeValuesInResponse=False,
             body={'values': values}
-        ).execute()
-
-        # Schedule the completion check
-        reminder_time = event_datetime + timedelta(minutes=duration_minutes)
-        scheduler.add_job(
-            send_event_check,
-            trigger=DateTrigger(run_date=reminder_time),
-            args=[update.effective_chat.id, event_description, event_id],
-            id=event_id
+        ))
+
+        # Remember the new row so later lookups can read it directly
+        match = UPDATED_RANGE_RE.search(append_result.get('updates', {}).get('updatedRange', ''))
+        if match:
+            EVENT_ROWS[event_id] = int(match.group(1))
+
+        # Schedule the completion check for when the event ends
+        EVENT_TASKS[event_id] = asyncio.create_task(
+            event_lifecycle(update.effective_chat.id, event_description, event_id, end_datetime)
         )
 
-        # Send confirmation
         await update.message.reply_text(
             f"✅ Event '{event_description}' has been created.\n"
-            f"📅 Date and Time: {event_datetime.strftime('%Y-%m-%d %H:%M')} - "
-            f"{(event_datetime + timedelta(minutes=duration_minutes)).strftime('%H:%M')}\n"
+            f"📅 Date and Time: {event_date_str} {event_time_str} - "
+            f"{end_datetime:%H:%M}\n"
             f"Duration: {duration_minutes} minutes"
         )
 
@@ -261,8 +319,7 @@ async def set_event(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ConversationHandler.END
 
     # First try structured format
-    pattern = r'^(.+?)\s*\|\s*(.+?)\s*\|\s*(\d+)\s*$'
-    match = re.match(pattern, command_removed, re.IGNORECASE)
+    match = STRUCTURED_RE.match(command_removed)
 
     try:
         if match:
@@ -270,7 +327,7 @@ async def set_event(update: Update, context: ContextTypes.DEFAULT_TYPE):
             event_description = match.group(1).strip()
             event_datetime_str = match.group(2).strip()
             duration_minutes = int(match.group(3))
-            event_datetime = dateparser.parse(event_datetime_str)
+            event_datetime = parse_event_datetime(event_datetime_str)
 
             if not event_datetime:
                 await update.message.reply_text("❌ Could not parse the date and time. Please ensure it's in a recognizable format.")
@@ -303,7 +360,7 @@ async def set_event(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(
             f"Please confirm the event details:\n"
             f"📝 Description: {context.user_data['pending_event']['description']}\n"
-            f"📅 Date and Time: {context.user_data['pending_event']['datetime'].strftime('%Y-%m-%d %H:%M')}\n"
+            f"📅 Date and Time: {context.user_data['pending_event']['datetime']:%Y-%m-%d %H:%M}\n"
             f"⏰ Duration: {context.user_data['pending_event']['duration']} minutes\n"
             f"\nReply with 'yes' to confirm or 'no' to cancel."
         )
@@ -365,53 +422,88 @@ async def send_event_check(chat_id, event_description, event_id):
             text=f"⏰ Your event '{event_description}' has ended.\nDid you complete it?",
             reply_markup=reply_markup
         )
-
-        # Schedule auto-update after 1 hour if no response
-        auto_update_time = datetime.now(pytz.timezone('Asia/Kuala_Lumpur')) + timedelta(hours=1)
-        scheduler.add_job(
-            auto_update_event_status,
-            trigger=DateTrigger(run_date=auto_update_time),
-            args=[event_id],
-            id=f"auto_update_{event_id}"
-        )
     except Exception as e:
         logger.error(f"Error sending event check: {e}")
 
+# Coroutine that follows an event from its end to the auto-update
+async def event_lifecycle(chat_id, event_description, event_id, end_time):
+    """Send the completion check when the event ends, then mark it missed if there is no reply."""
+    try:
+        await asyncio.sleep(max(0, (end_time - datetime.now(end_time.tzinfo)).total_seconds()))
+        await send_event_check(chat_id, event_description, event_id)
+        await asyncio.sleep(AUTO_UPDATE_DELAY)
+        await auto_update_event_status(event_id)
+    finally:
+        EVENT_TASKS.pop(event_id, None)
+
+# Helper to get the cached Events index while it is still fresh
+def cached_events_index():
+    """Return the cached {event_id: (row_number, row)} index, or None once it has expired."""
+    cache = EVENTS_INDEX_CACHE
+    if cache['index'] is not None and time.monotonic() - cache['ts'] < EVENTS_INDEX_TTL:
+        return cache['index']
+    return None
+
+# Helper to load the Events sheet as an index keyed by Event ID
+async def load_events_index(sheets_service):
+    """Fetch the Events sheet and cache it as {event_id: (row_number, row)}."""
+    result = await execute_async(sheets_service.spreadsheets().values().get(
+        spreadsheetId=SPREADSHEET_ID,
+        range='Events!A:E'
+    ))
+    rows = result.get('values', [])[1:]
+    index = {
+        row[COL_EVENT_ID]: (row_number, row)
+        for row_number, row in enumerate(rows, start=2)
+        if len(row) > COL_EVENT_ID
+    }
+    EVENTS_INDEX_CACHE['ts'], EVENTS_INDEX_CACHE['index'] = time.monotonic(), index
+    return index
+
+# Helper to find an event's row in the Events sheet
+async def find_event_row(sheets_service, event_id):
+    """Return (row_number, row) for an event, or (None, None) if it isn't in the sheet."""
+    index = cached_events_index()
+    if index and event_id in index:
+        return index[event_id]
+
+    # Events created by this process know their row, so read just that row
+    row_number = EVENT_ROWS.get(event_id)
+    if row_number:
+        result = await execute_async(sheets_service.spreadsheets().values().get(
+            spreadsheetId=SPREADSHEET_ID,
+            range=f'Events!A{row_number}:E{row_number}',
+            valueRenderOption='UNFORMATTED_VALUE'
+        ))
+        rows = result.get('values', [])
+        if rows and len(rows[0]) > COL_EVENT_ID and rows[0][COL_EVENT_ID] == event_id:
+            return row_number, rows[0]
+        # The row has moved (sorted or deleted), so fall back to a full read
+        EVENT_ROWS.pop(event_id, None)
+
+    index = await load_events_index(sheets_service)
+    return index.get(event_id, (None, None))
+
 # Function to auto-update event status
 async def auto_update_event_status(event_id):
     """Automatically update event status to 'Missed' if no response after timeout."""
     try:
-        sheets_service = get_sheets_service()
+        sheets_service = cached_sheets_service()
+        row_number, row = await find_event_row(sheets_service, event_id)
 
-        # Read current data
-        result = sheets_service.spreadsheets().values().get(
-            spreadsheetId=SPREADSHEET_ID,
-            range='Events!A:E'
-        ).execute()
-        values = result.get('values', [])
-
-        if not values or len(values) < 2:
-            logger.warning("No events found in sheet for auto-update")
+        if not row_number:
+            logger.warning(f"Event {event_id} not found in sheet for auto-update")
             return
 
-        # Find the event
-        headers = values[0]
-        events = [dict(zip(headers, row)) for row in values[1:]]
-
-        row_number = None
-        for idx, record in enumerate(events, start=2):
-            if record.get('Event ID') == event_id and record.get('Status') == 'Pending':
-                row_number = idx
-                break
-
-        if row_number:
+        if row[COL_STATUS] == 'Pending':
             # Update to 'Missed' if still pending
-            sheets_service.spreadsheets().values().update(
+            await execute_async(sheets_service.spreadsheets().values().update(
                 spreadsheetId=SPREADSHEET_ID,
                 range=f'Events!B{row_number}',
                 valueInputOption='RAW',
                 body={'values': [['Missed']]}
-            ).execute()
+            ))
+            row[COL_STATUS] = 'Missed'
             logger.info(f"Event {event_id} auto-updated to 'Missed' due to no response")
 
     except Exception as e:
@@ -432,53 +524,32 @@ async def handle_event_response(update: Update, context: ContextTypes.DEFAULT_TY
 
         status, event_id = data
 
-        # Get Sheets service
-        sheets_service = get_sheets_service()
-
-        # Read current data
-        result = sheets_service.spreadsheets().values().get(
-            spreadsheetId=SPREADSHEET_ID,
-            range='Events!A:E'
-        ).execute()
-        values = result.get('values', [])
-
-        if not values or len(values) < 2:
-            await query.edit_message_text("❌ No events found in the sheet.")
-            return
-
-        # Process sheet data
-        headers = values[0]
-        events = [dict(zip(headers, row)) for row in values[1:]]
-
         # Find the event
-        row_number = None
-        event_description = None
-        for idx, record in enumerate(events, start=2):
-            if record.get('Event ID') == event_id:
-                row_number = idx
-                event_description = record.get('Event Description')
-                break
+        sheets_service = cached_sheets_service()
+        row_number, row = await find_event_row(sheets_service, event_id)
 
         if not row_number:
             await query.edit_message_text("❌ Event not found in the sheet.")
             return
 
+        event_description = row[COL_DESCRIPTION]
+
         # Update status
         new_status = 'Done' if status == "event_done" else 'Missed'
 
         # Update the sheet
-        sheets_service.spreadsheets().values().update(
+        await execute_async(sheets_service.spreadsheets().values().update(
             spreadsheetId=SPREADSHEET_ID,
             range=f'Events!B{row_number}',
             valueInputOption='RAW',
             body={'values': [[new_status]]}
-        ).execute()
+        ))
+        row[COL_STATUS] = new_status
 
-        # Cancel auto-update job if it exists
-        try:
-            scheduler.remove_job(f"auto_update_{event_id}")
-        except Exception:
-            pass  # Job might not exist, that's okay
+        # Cancel the pending auto-update
+        task = EVENT_TASKS.pop(event_id, None)
+        if task:
+            task.cancel()
 
         # Send confirmation
         emoji = "✅" if status == "event_done" else "❌"
@@ -493,11 +564,10 @@ async def handle_event_response(update: Update, context: ContextTypes.DEFAULT_TY
 # Command: /eventtoday
 async def event_today(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """View today's events."""
-    service = get_calendar_service()
+    service = cached_calendar_service()
 
     # Define the time range for today in your local timezone
-    local_tz = pytz.timezone('Asia/Kuala_Lumpur')  # Replace with your timezone if different
-    now = datetime.now(local_tz)
+    now = datetime.now(LOCAL_TZ)
     start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
     end_of_day = start_of_day + timedelta(days=1)
 
@@ -506,13 +576,13 @@ async def event_today(update: Update, context: ContextTypes.DEFAULT_TYPE):
     time_max = end_of_day.isoformat()
 
     # Fetch events from Google Calendar within the specified time range
-    events_result = service.events().list(
+    events_result = await execute_async(service.events().list(
         calendarId='primary',
         timeMin=time_min,
         timeMax=time_max,
         singleEvents=True,
         orderBy='startTime'
-    ).execute()
+    ))
 
     events = events_result.get('items', [])
 
@@ -522,10 +592,13 @@ async def event_today(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     message = "📅 **Today's Events:**\n"
     for idx, event in enumerate(events, start=1):
-        # Get the event start time
-        start = event['start'].get('dateTime', event['start'].get('date'))
-        # Parse and format the event time
-        event_time = dateparser.parse(start).astimezone(local_tz).strftime('%H:%M')
+        # Parse and format the event start time (RFC3339, or a bare date for all-day events)
+        start = event['start'].get('dateTime')
+        if start:
+            start_dt = datetime.fromisoformat(start.replace('Z', '+00:00')).astimezone(LOCAL_TZ)
+        else:
+            start_dt = LOCAL_TZ.localize(datetime.strptime(event['start']['date'], '%Y-%m-%d'))
+        event_time = f"{start_dt:%H:%M}"
         # Get the event summary or title
         summary = event.get('summary', 'No Title')
         message += f"{idx}. {summary} at {event_time}\n"
@@ -1,25 +1,37 @@
 # habit_tracker_bot.py
 
 import os
+import asyncio
 from dotenv import load_dotenv
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
+    AIORateLimiter,
     Application,
     CommandHandler,
     CallbackQueryHandler,
     ContextTypes,
 )
 from datetime import datetime, timedelta
-import pytz
+from zoneinfo import ZoneInfo
 import re
-import calendar
+import uuid
+import sqlite3
+import time
+import threading
+import httplib2
+from itertools import zip_longest
+import weakref
+from functools import lru_cache
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.date import DateTrigger
+from apscheduler.triggers.cron import CronTrigger
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from google.auth.transport.requests import Request
+from google_auth_httplib2 import AuthorizedHttp
 from typing import Optional
 
 # Load environment variables from .env file
@@ -36,6 +48,11 @@ logger = logging.getLogger(__name__)
 TOKEN = os.getenv('HABIT_TRACKER_BOT_TOKEN')  # Ensure this is set correctly
 SPREADSHEET_ID = os.getenv('SPREADSHEET_ID')  # Ensure this is set correctly
 
+# Optional webhook settings; without WEBHOOK_URL the bot falls back to long polling
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+
 if not TOKEN:
     raise ValueError("No token provided. Set the TELEGRAM_BOT_TOKEN environment variable.")
 
@@ -48,67 +65,138 @@ SCOPES = [
     'https://www.googleapis.com/auth/spreadsheets'
 ]
 
+# Local timezone (replace with your timezone)
+LOCAL_TZ = ZoneInfo('Asia/Kuala_Lumpur')
+LOCAL_TZ_NAME = str(LOCAL_TZ)
+
 # Initialize APScheduler
-scheduler = AsyncIOScheduler(timezone='Asia/Kuala_Lumpur')  # Replace with your timezone
+# Job defaults: merge missed runs into one, allow 5 minutes of lateness, and
+# never run a second copy of a job while the first is still waiting on the network
+scheduler = AsyncIOScheduler(
+    timezone=LOCAL_TZ,
+    job_defaults={'coalesce': True, 'misfire_grace_time': 300, 'max_instances': 1}
+)
 scheduler.start()
 
-# Initialize the application globally
-application = None
+# Credentials are loaded once and only reloaded when they stop being valid;
+# the lock keeps worker threads from refreshing them at the same time
+CREDENTIALS = None
+CREDENTIALS_LOCK = threading.Lock()
+
+# httplib2 connections are not thread-safe, so each worker thread keeps its own
+thread_local = threading.local()
 
 def get_credentials():
     """Get and refresh Google OAuth2 credentials."""
-    try:
-        creds = None
-        if os.path.exists('token.json'):
-            try:
-                creds = Credentials.from_authorized_user_file('token.json', SCOPES)
-                logger.info("Loaded existing credentials from token.json")
-            except Exception as e:
-                logger.error(f"Error loading token.json: {e}")
-                os.remove('token.json')
-                logger.info("Removed invalid token.json")
-
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                logger.info("Refreshing expired credentials")
-                creds.refresh(Request())
-            else:
-                if not os.path.exists('credentials.json'):
-                    raise FileNotFoundError("credentials.json not found")
-
-                logger.info("Initiating new OAuth flow")
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    'credentials.json',
-                    SCOPES
-                )
-                creds = flow.run_local_server(
-                    port=0,
-                    access_type='offline',
-                    prompt='consent'
-                )
-
-            logger.info("Saving new credentials to token.json")
-            with open('token.json', 'w') as token:
-                token.write(creds.to_json())
-
+    global CREDENTIALS
+    creds = CREDENTIALS
+    if creds and creds.valid:
         return creds
 
-    except Exception as e:
-        logger.error(f"Error in get_credentials: {e}")
-        raise
+    with CREDENTIALS_LOCK:
+        try:
+            creds = CREDENTIALS
+            if creds and creds.valid:
+                return creds  # Another thread refreshed them while we waited
+
+            if not creds and os.path.exists('token.json'):
+                try:
+                    creds = Credentials.from_authorized_user_file('token.json', SCOPES)
+                    logger.info("Loaded existing credentials from token.json")
+                except Exception as e:
+                    logger.error(f"Error loading token.json: {e}")
+                    os.remove('token.json')
+                    logger.info("Removed invalid token.json")
+
+            if not creds or not creds.valid:
+                previous_token = creds.token if creds else None
+                if creds and creds.expired and creds.refresh_token:
+                    logger.info("Refreshing expired credentials")
+                    creds.refresh(Request())
+                else:
+                    if not os.path.exists('credentials.json'):
+                        raise FileNotFoundError("credentials.json not found")
+
+                    logger.info("Initiating new OAuth flow")
+                    flow = InstalledAppFlow.from_client_secrets_file(
+                        'credentials.json',
+                        SCOPES
+                    )
+                    creds = flow.run_local_server(
+                        port=0,
+                        access_type='offline',
+                        prompt='consent'
+                    )
 
+                # Only rewrite token.json when the token actually changed
+                if creds.token != previous_token:
+                    logger.info("Saving new credentials to token.json")
+                    with open('token.json', 'w') as token:
+                        token.write(creds.to_json())
+
+            CREDENTIALS = creds
+            return creds
+
+        except Exception as e:
+            logger.error(f"Error in get_credentials: {e}")
+            raise
+
+@lru_cache(maxsize=1)
 def get_sheets_service():
-    """Initialize Google Sheets API service."""
+    """Initialize Google Sheets API service (built once and reused)."""
     creds = get_credentials()
-    service = build('sheets', 'v4', credentials=creds)
+    service = build('sheets', 'v4', credentials=creds, cache_discovery=False, static_discovery=True)
     return service
 
+@lru_cache(maxsize=1)
 def get_calendar_service():
-    """Initialize Google Calendar API service."""
+    """Initialize Google Calendar API service (built once and reused)."""
     creds = get_credentials()
-    service = build('calendar', 'v3', credentials=creds)
+    service = build('calendar', 'v3', credentials=creds, cache_discovery=False, static_discovery=True)
     return service
 
+# Helper function to refresh the shared credentials after the API rejected their token
+def refresh_credentials(stale_token):
+    """Refresh CREDENTIALS under the lock unless another thread already replaced stale_token."""
+    with CREDENTIALS_LOCK:
+        creds = CREDENTIALS
+        if creds.token == stale_token:
+            logger.info("Refreshing credentials rejected by the API")
+            creds.refresh(Request())
+            with open('token.json', 'w') as token:
+                token.write(creds.to_json())
+
+def get_thread_http():
+    """Return the calling thread's authorized connection, creating it on first use."""
+    http = getattr(thread_local, 'http', None)
+    if http is None:
+        # No 401 refresh here: it would bypass CREDENTIALS_LOCK, so execute_request handles it
+        http = thread_local.http = AuthorizedHttp(
+            get_credentials(), http=httplib2.Http(timeout=30), refresh_status_codes=()
+        )
+    return http
+
+# Execute a googleapiclient request on the calling thread's connection
+def execute_request(request):
+    """Execute a request, refreshing the shared credentials under CREDENTIALS_LOCK first and after a 401."""
+    token = get_credentials().token
+    try:
+        return request.execute(http=get_thread_http())
+    except HttpError as e:
+        if e.resp.status != 401:
+            raise
+        refresh_credentials(token)
+        return request.execute(http=get_thread_http())
+
+# Cap on Google API requests in flight, so a burst of habit jobs can't exhaust the thread pool
+GOOGLE_API_SEMAPHORE = asyncio.Semaphore(4)
+
+# Run a blocking googleapiclient request in a worker thread
+async def execute_async(request):
+    """Execute a Google API request without blocking the event loop."""
+    async with GOOGLE_API_SEMAPHORE:
+        return await asyncio.to_thread(execute_request, request)
+
 # Define your habits
 HABITS = [
     {
@@ -143,12 +231,98 @@ HABITS = [
     },
 ]
 
-# Global dictionary to store user chat IDs (supports multiple users)
-USER_CHAT_IDS = {}
+# Weekday numbers (Monday is 0) used by habit frequencies
+WEEKDAYS = {
+    'monday': 0,
+    'tuesday': 1,
+    'wednesday': 2,
+    'thursday': 3,
+    'friday': 4,
+    'saturday': 5,
+    'sunday': 6,
+}
+ALL_DAYS_MASK = 0b1111111
+DAY_ABBRS = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+
+# Helper function to turn a habit frequency into a weekday bitmask
+def weekday_mask(frequency):
+    """Return a 7-bit mask (bit 0 = Monday) of the weekdays a frequency string covers."""
+    mask = 0
+    for freq in frequency.split(','):
+        freq = freq.strip().lower()
+        if freq == 'daily':
+            mask |= ALL_DAYS_MASK
+        elif freq in WEEKDAYS:
+            mask |= 1 << WEEKDAYS[freq]
+        else:
+            logger.warning(f"Unknown frequency: {freq}")
+    return mask
+
+# Parse each habit's frequency and time once at load
+for habit in HABITS:
+    habit_time = datetime.strptime(habit['time'], '%H:%M')
+    habit['weekday_mask'] = weekday_mask(habit['frequency'])
+    habit['hour_minute'] = (habit_time.hour, habit_time.minute)
+
+# Helper function to render a habit frequency for display
+def frequency_label(frequency):
+    """Return 'Daily' or the capitalized list of weekdays."""
+    if frequency == 'daily':
+        return 'Daily'
+    return ', '.join(day.capitalize() for day in frequency.split(','))
+
+# Precomputed /sethabits reply
+HABITS_HELP_TEXT = "Habits are already set up in the system.\n\nCurrent habits:\n" + "".join(
+    f"- {habit['description']} ({frequency_label(habit['frequency'])})\n" for habit in HABITS
+)
+
+# Persisted bot state, so registered chats and the Event ID index survive restarts
+STATE_DB = sqlite3.connect('state.db')
+STATE_DB.executescript(
+    'CREATE TABLE IF NOT EXISTS chats (id INTEGER PRIMARY KEY);'
+    'CREATE TABLE IF NOT EXISTS events (id TEXT PRIMARY KEY, row INTEGER, description TEXT, date TEXT);'
+)
+
+# Chat IDs of every user who sent /start (supports multiple users)
+USER_CHAT_IDS = {chat_id for (chat_id,) in STATE_DB.execute('SELECT id FROM chats')}
 
 # Define states for ConversationHandler
 CONFIRMATION = 1
 
+# Index of logged habits: event_id -> (row_number, description, date), loaded from state.db
+EVENT_ID_INDEX = {
+    event_id: (row_number, description, date_str)
+    for event_id, row_number, description, date_str in STATE_DB.execute('SELECT * FROM events')
+}
+UPDATED_RANGE_RE = re.compile(r'![A-Z]+(\d+)')
+
+# Habits sheet column positions (Habit Description, Status, Date, Time, Event ID)
+COL_DESCRIPTION = 0
+COL_STATUS = 1
+COL_DATE = 2
+COL_EVENT_ID = 4
+
+# Habits sheet rows grouped by date, reused for HABITS_INDEX_TTL seconds
+HABITS_INDEX_TTL = 30
+HABITS_INDEX_CACHE = {'ts': 0.0, 'by_date': None}
+HABITS_INDEX_LOCK = asyncio.Lock()  # One sheet read at a time; concurrent callers share it
+
+# Pending Sheets writes, flushed in batches by sheets_writer: cell updates are
+# {'range': ..., 'values': ...}; new habit rows are {'append': row, 'event_id': ...}
+SHEETS_WRITE_QUEUE = asyncio.Queue()
+WRITE_BATCH_SIZE = 100
+WRITE_BATCH_WAIT = 0.2  # seconds to wait for more writes before flushing
+WRITE_MAX_ATTEMPTS = 5
+WRITE_RETRY_DELAY = 5  # seconds to wait before retrying a failed batch
+WRITE_RETRIES = []  # Failed writes, flushed ahead of newer ones so later status writes still win
+sheets_writer_task = None
+
+# Outgoing habit check messages as (chat_id, text, reply_markup), sent by a fixed pool
+# of habit_sender workers so one slow chat never holds up the rest
+SEND_QUEUE = asyncio.Queue()
+SENDER_WORKERS = 8
+sender_tasks = []
+
 # Error handler
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
     """Log the error and send a message to the user."""
@@ -163,7 +337,10 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Store user's chat ID and send welcome message."""
     user_id = update.effective_chat.id
-    USER_CHAT_IDS[user_id] = update.effective_chat.id
+    if user_id not in USER_CHAT_IDS:
+        USER_CHAT_IDS.add(user_id)
+        with STATE_DB:
+            STATE_DB.execute('INSERT OR IGNORE INTO chats (id) VALUES (?)', (user_id,))
     logger.info(f"User {user_id} started the Habit Tracker Bot.")
     await update.message.reply_text(
         "👋 Hi! I'm your Habit Tracker Bot.\n"
@@ -183,40 +360,218 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # Command: /sethabits
 async def set_habits(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Inform the user that habits are already set up."""
-    habits_info = "Habits are already set up in the system.\n\nCurrent habits:\n"
-    for habit in HABITS:
-        freq = habit['frequency']
-        if freq == 'daily':
-            freq_info = 'Daily'
-        else:
-            freq_info = ', '.join([day.capitalize() for day in freq.split(',')])
-        habits_info += f"- {habit['description']} ({freq_info})\n"
-    await update.message.reply_text(habits_info)
+    await update.message.reply_text(HABITS_HELP_TEXT)
+
+# Helper function to persist Event ID index entries
+def save_event_rows(entries, removed=()):
+    """Write {event_id: (row_number, description, date)} entries to state.db and drop removed ids."""
+    with STATE_DB:
+        if removed:
+            STATE_DB.executemany('DELETE FROM events WHERE id = ?', [(event_id,) for event_id in removed])
+        STATE_DB.executemany(
+            'INSERT OR REPLACE INTO events (id, row, description, date) VALUES (?, ?, ?, ?)',
+            [(event_id, *entry) for event_id, entry in entries.items()]
+        )
+
+# Helper function to rebuild the Event ID index from the Habits sheet
+def index_habit_rows(values):
+    """Rebuild EVENT_ID_INDEX and the by-date cache from Habits sheet values (header row included)."""
+    by_date = {}
+    new_index = {}
+    for row_number, row in enumerate(values[1:], start=2):
+        if len(row) > COL_EVENT_ID and row[COL_EVENT_ID]:
+            by_date.setdefault(row[COL_DATE], []).append(row)
+            new_index[row[COL_EVENT_ID]] = (row_number, row[COL_DESCRIPTION], row[COL_DATE])
+
+    # Only touch state.db for entries that changed, so a routine refresh does no disk I/O
+    changed = {event_id: entry for event_id, entry in new_index.items() if EVENT_ID_INDEX.get(event_id) != entry}
+    removed = EVENT_ID_INDEX.keys() - new_index.keys()
+    if changed or removed:
+        save_event_rows(changed, removed)
+    EVENT_ID_INDEX.clear()
+    EVENT_ID_INDEX.update(new_index)
+
+    HABITS_INDEX_CACHE['ts'], HABITS_INDEX_CACHE['by_date'] = time.monotonic(), by_date
+    return by_date
+
+# Helper function to build the narrow Habits read
+def habit_columns_request(sheets_service):
+    """Request only the Description/Status/Date and Event ID columns, column-major."""
+    return sheets_service.spreadsheets().values().batchGet(
+        spreadsheetId=SPREADSHEET_ID,
+        ranges=['Habits!A:C', 'Habits!E:E'],
+        majorDimension='COLUMNS',
+        fields='valueRanges(values)'
+    )
+
+# Helper function to turn the columnar read back into positional rows
+def rows_from_columns(result):
+    """Rebuild Habits rows (header included) from habit_columns_request's response."""
+    value_ranges = result.get('valueRanges', [])
+    columns = value_ranges[0].get('values', []) if value_ranges else []
+    descriptions, statuses, dates = (columns + [[], [], []])[:3]
+    event_ids = (value_ranges[1].get('values') or [[]])[0] if len(value_ranges) > 1 else []
+    return [
+        [description, status, date_str, '', event_id]  # Time (column D) isn't read
+        for description, status, date_str, event_id in zip_longest(
+            descriptions, statuses, dates, event_ids, fillvalue=''
+        )
+    ]
+
+# Helper function to load the Habits sheet indices
+async def load_habit_indices(sheets_service, force=False):
+    """Return Habits rows grouped by date, re-reading the sheet once the cache is stale."""
+    cache = HABITS_INDEX_CACHE
+    requested_at = time.monotonic()
+    if not force and cache['by_date'] is not None and requested_at - cache['ts'] < HABITS_INDEX_TTL:
+        return cache['by_date']
+
+    async with HABITS_INDEX_LOCK:
+        # Reuse a read that finished while we were waiting for the lock
+        if cache['by_date'] is not None and cache['ts'] >= requested_at:
+            return cache['by_date']
+
+        result = await execute_async(habit_columns_request(sheets_service))
+        return index_habit_rows(rows_from_columns(result))
+
+# Helper function to write a batch of queued writes
+async def flush_sheets_writes(batch):
+    """Append queued rows and batchUpdate queued cells (one per range); return the items that failed."""
+    appends = [item for item in batch if 'append' in item]
+    # Later writes to the same range supersede earlier ones (e.g. ❌ then ✅ on one habit)
+    updates = list({item['range']: item for item in batch if 'append' not in item}.values())
+    failed = []
 
-# Helper function to find the row number of a habit in Google Sheets
-def get_habit_row(sheets_service, habit_description, date_str):
-    """Find the row number of a habit in Google Sheets based on description and date."""
     try:
-        result = sheets_service.spreadsheets().values().get(
-            spreadsheetId=SPREADSHEET_ID,
-            range='Habits!A:E'
-        ).execute()
-        values = result.get('values', [])
-
-        if not values or len(values) < 2:
-            return None
-
-        headers = values[0]
-        for idx, row in enumerate(values[1:], start=2):
-            row_dict = dict(zip(headers, row))
-            if (row_dict.get('Habit Description', '').lower() == habit_description.lower() and
-                    row_dict.get('Date', '') == date_str):
-                return idx
-
-        return None
+        sheets_service = get_sheets_service()
     except Exception as e:
-        logger.error(f"Error in get_habit_row: {e}")
-        return None
+        logger.error(f"Error getting Sheets service in flush_sheets_writes: {e}")
+        return appends + updates
+
+    if appends:
+        try:
+            result = await execute_async(sheets_service.spreadsheets().values().append(
+                spreadsheetId=SPREADSHEET_ID,
+                range='Habits!A:E',
+                valueInputOption='RAW',
+                body={'values': [item['append'] for item in appends]}
+            ))
+            logger.info(f"Logged {len(appends)} habit(s) in Google Sheets.")
+
+            # Index the new rows so responses don't have to search the sheet
+            match = UPDATED_RANGE_RE.search(result.get('updates', {}).get('updatedRange', ''))
+            if match:
+                first_row = int(match.group(1))
+                new_rows = {
+                    item['event_id']: (first_row + offset, item['append'][COL_DESCRIPTION], item['append'][COL_DATE])
+                    for offset, item in enumerate(appends)
+                }
+                EVENT_ID_INDEX.update(new_rows)
+                save_event_rows(new_rows)
+            HABITS_INDEX_CACHE['ts'] = 0.0  # The by-date cache doesn't have the new rows yet
+        except Exception as e:
+            logger.error(f"Error appending habits in flush_sheets_writes: {e}")
+            failed.extend(appends)
+
+    if updates:
+        try:
+            await execute_async(sheets_service.spreadsheets().values().batchUpdate(
+                spreadsheetId=SPREADSHEET_ID,
+                body={
+                    'valueInputOption': 'RAW',
+                    'data': [{'range': item['range'], 'values': item['values']} for item in updates]
+                }
+            ))
+            logger.info(f"Flushed {len(updates)} queued update(s) to Google Sheets.")
+        except Exception as e:
+            logger.error(f"Error in flush_sheets_writes: {e}")
+            failed.extend(updates)
+
+    return failed
+
+# Helper function to keep failed writes for another attempt
+def retry_failed_writes(failed):
+    """Hold failed writes for the next flush, giving up on an item after WRITE_MAX_ATTEMPTS."""
+    for item in failed:
+        item['attempts'] = item.get('attempts', 0) + 1
+        if item['attempts'] < WRITE_MAX_ATTEMPTS:
+            WRITE_RETRIES.append(item)
+        elif 'append' in item:
+            logger.error(f"Giving up on logging habit {item['event_id']} after {WRITE_MAX_ATTEMPTS} attempts.")
+            # Without its row the habit can't be answered, so don't ask about it
+            reminder_job_id = f"habit_check_{item['event_id']}"
+            if scheduler.get_job(reminder_job_id):
+                scheduler.remove_job(reminder_job_id)
+        else:
+            logger.error(f"Giving up on writing {item['range']} after {WRITE_MAX_ATTEMPTS} attempts.")
+
+# Background task that drains the write queue
+async def sheets_writer():
+    """Collect queued writes for up to WRITE_BATCH_WAIT seconds and flush them together."""
+    loop = asyncio.get_running_loop()
+    stopping = False
+    while not stopping:
+        if WRITE_RETRIES:
+            # Back off before retrying; retried writes go first so newer writes to the same range win
+            await asyncio.sleep(WRITE_RETRY_DELAY)
+            batch = WRITE_RETRIES[:]
+            WRITE_RETRIES.clear()
+        else:
+            batch = [await SHEETS_WRITE_QUEUE.get()]
+        deadline = loop.time() + WRITE_BATCH_WAIT
+        while len(batch) < WRITE_BATCH_SIZE and None not in batch:
+            try:
+                batch.append(await asyncio.wait_for(SHEETS_WRITE_QUEUE.get(), deadline - loop.time()))
+            except asyncio.TimeoutError:
+                break
+
+        # None is the shutdown sentinel: flush what was collected before it, then stop
+        if None in batch:
+            stopping = True
+            batch.remove(None)
+        if not batch:
+            continue
+
+        # Nothing here may end the loop, or queued writes would never be drained again
+        try:
+            failed = await flush_sheets_writes(batch)
+        except Exception as e:
+            logger.error(f"Error in sheets_writer: {e}")
+            failed = batch
+        retry_failed_writes(failed)
+
+# Background task that sends queued habit check messages
+async def habit_sender(bot):
+    """Send queued habit checks one at a time; the rate limiter paces the pool as a whole."""
+    while True:
+        user_id, text, reply_markup = await SEND_QUEUE.get()
+        try:
+            await bot.send_message(chat_id=user_id, text=text, reply_markup=reply_markup)
+            logger.info(f"Sent habit check to user {user_id}: {text}")
+        except Exception as e:
+            logger.error(f"Error sending habit check to user {user_id}: {e}")
+        finally:
+            SEND_QUEUE.task_done()
+
+# Application hooks that start the background workers and flush pending writes on shutdown
+async def start_background_tasks(app: Application):
+    global sheets_writer_task
+    sheets_writer_task = asyncio.create_task(sheets_writer())
+    sender_tasks[:] = [asyncio.create_task(habit_sender(app.bot)) for _ in range(SENDER_WORKERS)]
+
+async def stop_background_tasks(app: Application):
+    for task in sender_tasks:
+        task.cancel()
+    if sheets_writer_task:
+        # Let the writer finish the batch it already holds instead of cancelling it mid-flush
+        SHEETS_WRITE_QUEUE.put_nowait(None)
+        await sheets_writer_task
+    batch = WRITE_RETRIES[:]
+    while not SHEETS_WRITE_QUEUE.empty():
+        batch.append(SHEETS_WRITE_QUEUE.get_nowait())
+    if batch:
+        for item in await flush_sheets_writes(batch):
+            logger.error(f"Unwritten Sheets change lost at shutdown: {item}")
 
 # Function to create habit event
 async def create_habit_event(habit_description: str, duration: int):
@@ -224,43 +579,41 @@ async def create_habit_event(habit_description: str, duration: int):
     logger.info(f"Executing create_habit_event for '{habit_description}' with duration {duration} minutes.")
     try:
         service = get_calendar_service()
-        sheets_service = get_sheets_service()
-        local_tz = pytz.timezone('Asia/Kuala_Lumpur')
-        now = datetime.now(local_tz)
+        now = datetime.now(LOCAL_TZ)
+
+        # Generate the event ID client-side (uuid hex is valid base32hex) so the
+        # Calendar insert and the Sheets append don't depend on each other
+        event_id = uuid.uuid4().hex
 
         # Create Google Calendar event
         event = {
+            'id': event_id,
             'summary': habit_description,
             'start': {
                 'dateTime': now.isoformat(),
-                'timeZone': str(local_tz),
+                'timeZone': LOCAL_TZ_NAME,
             },
             'end': {
                 'dateTime': (now + timedelta(minutes=duration)).isoformat(),
-                'timeZone': str(local_tz),
+                'timeZone': LOCAL_TZ_NAME,
             },
         }
 
-        created_event = service.events().insert(calendarId='primary', body=event).execute()
-        event_id = created_event.get('id')
+        # Insert the calendar event first, so a failed insert never leaves a Pending row behind
+        await execute_async(service.events().insert(calendarId='primary', body=event))
         logger.info(f"Created Google Calendar event '{habit_description}' with ID {event_id}.")
 
-        # Log the habit in Google Sheets
-        values = [[
-            habit_description,
-            'Pending',
-            now.strftime('%Y-%m-%d'),
-            now.strftime('%H:%M'),
-            event_id
-        ]]
-
-        sheets_service.spreadsheets().values().append(
-            spreadsheetId=SPREADSHEET_ID,
-            range='Habits!A:E',
-            valueInputOption='RAW',
-            body={'values': values}
-        ).execute()
-        logger.info(f"Logged habit '{habit_description}' in Google Sheets.")
+        # Queue the habit row; sheets_writer appends it together with any other new rows
+        SHEETS_WRITE_QUEUE.put_nowait({
+            'append': [
+                habit_description,
+                'Pending',
+                now.strftime('%Y-%m-%d'),
+                now.strftime('%H:%M'),
+                event_id
+            ],
+            'event_id': event_id
+        })
 
         # Schedule a reminder to check habit completion
         reminder_time = now + timedelta(minutes=duration + 30)
@@ -270,211 +623,175 @@ async def create_habit_event(habit_description: str, duration: int):
             send_habit_check,
             trigger=DateTrigger(run_date=reminder_time),
             args=[habit_description, event_id],
-            id=reminder_job_id,
-            coalesce=True,  # Prevent overlapping jobs
-            misfire_grace_time=300  # 5 minutes grace period
+            id=reminder_job_id
         )
         logger.info(f"Scheduled habit check for '{habit_description}' at {reminder_time}.")
 
     except Exception as e:
         logger.error(f"Error in create_habit_event: {e}")
 
-# Function to send habit check
-async def send_habit_check(habit_description: str, event_id: str):
-    """Send a message to check if a habit was completed."""
-    global application
-    if not USER_CHAT_IDS:
-        logger.error("No chat IDs available. Make sure users have sent /start first.")
-        return
-
-    for user_id in USER_CHAT_IDS.values():
-        keyboard = [
-            [
-                InlineKeyboardButton("✅ Yes", callback_data=f"habit_done|{event_id}"),
-                InlineKeyboardButton("❌ No", callback_data=f"habit_missed|{event_id}")
-            ]
+# Helper function to build the Yes/No keyboard for a habit check
+@lru_cache(maxsize=512)
+def kb_for(event_id: str):
+    """Return the (shared) completion keyboard for a habit event."""
+    return InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton("✅ Yes", callback_data=f"habit_done|{event_id}"),
+            InlineKeyboardButton("❌ No", callback_data=f"habit_missed|{event_id}")
+        ]
+    ])
+
+# Opening line of the combined /habitcheck message
+COMBINED_CHECK_HEADER = "Did you complete these habits today?"
+
+# Helper function to build the combined keyboard for several habit checks
+def kb_for_many(rows):
+    """Return one numbered ✅/❌ button row per habit row, matching the numbered message text."""
+    return InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton(f"✅ {number}", callback_data=f"habit_done|{row[COL_EVENT_ID]}"),
+            InlineKeyboardButton(f"❌ {number}", callback_data=f"habit_missed|{row[COL_EVENT_ID]}")
         ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        for number, row in enumerate(rows, start=1)
+    ])
 
-        try:
-            await application.bot.send_message(
-                chat_id=user_id,
-                text=f"Did you complete the habit '{habit_description}' today?",
-                reply_markup=reply_markup
-            )
-            logger.info(f"Sent habit check for: {habit_description} to user {user_id}")
-        except Exception as e:
-            logger.error(f"Error sending habit check to user {user_id}: {e}")
+# Helper function to queue one message for every user
+def broadcast_habit_check(text: str, reply_markup: InlineKeyboardMarkup) -> bool:
+    """Queue a habit check message for every known chat; False if there is nobody to send to."""
+    if not USER_CHAT_IDS:
+        logger.error("No chat IDs available. Make sure users have sent /start first.")
+        return False
 
-# Function to schedule habits two days in advance using APScheduler
-def schedule_habits_two_days_ahead(app: Application):
-    """Schedule habits two days in advance using APScheduler."""
-    local_tz = pytz.timezone('Asia/Kuala_Lumpur')
-    days_map = {
-        'monday': 'mon',
-        'tuesday': 'tue',
-        'wednesday': 'wed',
-        'thursday': 'thu',
-        'friday': 'fri',
-        'saturday': 'sat',
-        'sunday': 'sun'
-    }
+    for user_id in USER_CHAT_IDS:
+        SEND_QUEUE.put_nowait((user_id, text, reply_markup))
+    return True
 
-    sheets_service = get_sheets_service()
+# Function to send habit check
+async def send_habit_check(habit_description: str, event_id: str):
+    """Queue a message to every user asking if a habit was completed."""
+    text = f"Did you complete the habit '{habit_description}' today?"
+    if broadcast_habit_check(text, kb_for(event_id)):
+        logger.info(f"Queued habit check for: {habit_description} to {len(USER_CHAT_IDS)} user(s)")
+
+# Function to schedule recurring habits using APScheduler
+def schedule_habits(app: Application):
+    """Schedule each habit as a recurring cron job using APScheduler."""
+    # Load the Event ID index so responses to earlier checks can be matched
+    try:
+        result = habit_columns_request(get_sheets_service()).execute()
+        index_habit_rows(rows_from_columns(result))
+    except Exception as e:
+        logger.error(f"Error fetching data from Google Sheets: {e}")
 
     for habit in HABITS:
-        frequencies = [freq.strip().lower() for freq in habit['frequency'].split(',')]
-        for freq in frequencies:
-            if freq == 'daily':
-                days_of_week = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
-            elif freq in days_map:
-                days_of_week = [days_map[freq]]
-            else:
-                logger.warning(f"Unknown frequency: {freq}")
-                continue
-
-            habit_time = datetime.strptime(habit['time'], '%H:%M').time()
-
-            # Schedule for the next two days
-            for day_offset in range(1, 3):
-                run_date = datetime.now(local_tz) + timedelta(days=day_offset)
-                target_weekday = run_date.weekday()  # Monday is 0
-                day_abbr = calendar.day_abbr[target_weekday].lower()
-
-                if day_abbr not in days_of_week:
-                    continue  # Skip if the day is not in the frequency
-
-                today_str = run_date.strftime('%Y-%m-%d')
-
-                # Check if the habit is already scheduled for this date
-                try:
-                    result = sheets_service.spreadsheets().values().get(
-                        spreadsheetId=SPREADSHEET_ID,
-                        range='Habits!A:E'
-                    ).execute()
-                    values = result.get('values', [])
-                    headers = values[0] if values else []
-                    habits_logged = [dict(zip(headers, row)) for row in values[1:]]
-                    already_scheduled = any(
-                        habit_logged.get('Habit Description', '').lower() == habit['description'].lower() and
-                        habit_logged.get('Date', '') == today_str
-                        for habit_logged in habits_logged
-                    )
-                except Exception as e:
-                    logger.error(f"Error fetching data from Google Sheets: {e}")
-                    continue  # Skip scheduling if there's an error
-
-                if already_scheduled:
-                    logger.info(f"Habit '{habit['description']}' already scheduled for {today_str}. Skipping.")
-                    continue  # Skip if already scheduled
-
-                # Schedule the habit event
-                run_datetime = run_date.replace(hour=habit_time.hour, minute=habit_time.minute, second=0, microsecond=0)
-                job_id = f"habit_{habit['description']}_{today_str}"
-
-                # Schedule the job only if it hasn't been scheduled yet
-                if not scheduler.get_job(job_id):
-                    scheduler.add_job(
-                        create_habit_event,
-                        trigger=DateTrigger(run_date=run_datetime),
-                        args=[habit['description'], habit['duration']],
-                        id=job_id,
-                        coalesce=True,  # Prevent overlapping jobs
-                        misfire_grace_time=300  # 5 minutes grace period
-                    )
-                    logger.info(f"Scheduled habit '{habit['description']}' for {today_str} at {habit['time']}")
+        if not habit['weekday_mask']:
+            continue  # No valid days in the frequency
+
+        hour, minute = habit['hour_minute']
+        days_of_week = ','.join(
+            day for bit, day in enumerate(DAY_ABBRS) if (habit['weekday_mask'] >> bit) & 1
+        )
+
+        # A stable job ID with replace_existing means restarts never add duplicates
+        scheduler.add_job(
+            create_habit_event,
+            trigger=CronTrigger(day_of_week=days_of_week, hour=hour, minute=minute, timezone=LOCAL_TZ),
+            args=[habit['description'], habit['duration']],
+            id=f"habit_{habit['description']}",
+            replace_existing=True
+        )
+        logger.info(f"Scheduled habit '{habit['description']}' on {days_of_week} at {habit['time']}")
 
     # Schedule a test habit 5 minutes from now
-    test_run_datetime = datetime.now(local_tz) + timedelta(minutes=5)
+    test_run_datetime = datetime.now(LOCAL_TZ) + timedelta(minutes=5)
     scheduler.add_job(
         create_habit_event,
         trigger=DateTrigger(run_date=test_run_datetime),
         args=["Test Habit", 10],  # Description and duration
         id="habit_Test_Habit_test_date",
-        coalesce=True,
-        misfire_grace_time=300
+        replace_existing=True
     )
     logger.info(f"Scheduled test habit 'Test Habit' for {test_run_datetime.strftime('%Y-%m-%d %H:%M:%S')}")
 
-# Callback handler for habit response
-async def handle_habit_response(update: Update, context: ContextTypes.DEFAULT_TYPE):
+# Per-event locks for handle_habit_response (updates are processed concurrently);
+# weakly held, so an entry disappears once no response is holding or waiting on it
+EVENT_LOCKS = weakref.WeakValueDictionary()
+
+# Callback data prefixes for the habit check buttons, routed with a plain startswith check
+HABIT_DONE_PREFIX = 'habit_done|'
+HABIT_MISSED_PREFIX = 'habit_missed|'
+
+# Callback handlers for the habit check buttons
+async def handle_habit_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Mark a habit as done."""
+    await handle_habit_response(update, update.callback_query.data[len(HABIT_DONE_PREFIX):], 'Done')
+
+async def handle_habit_missed(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Mark a habit as missed."""
+    await handle_habit_response(update, update.callback_query.data[len(HABIT_MISSED_PREFIX):], 'Missed')
+
+# Shared handler for habit responses
+async def handle_habit_response(update: Update, event_id: str, new_status: str):
     """Handle user's response to habit completion check."""
     query = update.callback_query
     await query.answer()
 
     try:
-        # Parse callback data
-        data = query.data.split('|')
-        if len(data) != 2:
-            await query.edit_message_text("❌ Invalid response.")
-            return
-
-        status, event_id = data
-
         # Get Sheets service
         sheets_service = get_sheets_service()
 
-        # Read current data
-        try:
-            result = sheets_service.spreadsheets().values().get(
-                spreadsheetId=SPREADSHEET_ID,
-                range='Habits!A:E'
-            ).execute()
-            values = result.get('values', [])
-        except Exception as e:
-            logger.error(f"Error fetching data from Google Sheets: {e}")
-            await query.edit_message_text("❌ An error occurred while accessing the habit list.")
-            return
-
-        if not values or len(values) < 2:
-            await query.edit_message_text("❌ No habits found in the sheet.")
-            return
-
-        # Process sheet data
-        headers = values[0]
-        habits = [dict(zip(headers, row)) for row in values[1:]]
-        logger.debug(f"Habits fetched: {habits}")
-
-        # Find the habit
-        row_number = None
-        habit_description = None
-        date_str = None
-        for record in habits:
-            if record.get('Event ID') == event_id:
-                habit_description = record.get('Habit Description')
-                date_str = record.get('Date')
-                row_number = get_habit_row(sheets_service, habit_description, date_str)
-                break
+        # One response per event at a time, so double taps can't race on the same row
+        lock = EVENT_LOCKS.setdefault(event_id, asyncio.Lock())
+        async with lock:
+            # Find the habit, refreshing the index from the sheet if it isn't known yet
+            if event_id not in EVENT_ID_INDEX:
+                try:
+                    await load_habit_indices(sheets_service, force=True)
+                except Exception as e:
+                    logger.error(f"Error fetching data from Google Sheets: {e}")
+                    await query.edit_message_text("❌ An error occurred while accessing the habit list.")
+                    return
 
-        if not row_number:
-            await query.edit_message_text("❌ Habit not found in the sheet.")
-            return
+            if event_id not in EVENT_ID_INDEX:
+                await query.edit_message_text("❌ Habit not found in the sheet.")
+                return
 
-        # Update status
-        new_status = 'Done' if status == "habit_done" else 'Missed'
-        try:
-            sheets_service.spreadsheets().values().update(
-                spreadsheetId=SPREADSHEET_ID,
-                range=f'Habits!B{row_number}',
-                valueInputOption='RAW',
-                body={'values': [[new_status]]}
-            ).execute()
+            row_number, habit_description, date_str = EVENT_ID_INDEX[event_id]
 
-            # Cancel the reminder job if it exists
-            reminder_job_id = f"habit_check_{event_id}"
-            if scheduler.get_job(reminder_job_id):
-                scheduler.remove_job(reminder_job_id)
-                logger.info(f"Removed reminder job {reminder_job_id}")
-
-            # Send confirmation
-            emoji = "✅" if new_status == "Done" else "❌"
-            await query.edit_message_text(
-                f"{emoji} Habit '{habit_description}' marked as {new_status}!"
-            )
-            logger.info(f"Updated habit status: {habit_description} -> {new_status}")
-        except Exception as e:
-            logger.error(f"Error updating habit status: {e}")
-            await query.edit_message_text("❌ An error occurred while updating the habit status.")
+            # Update status
+            try:
+                # Queue the write; sheets_writer batches it with any other pending updates
+                SHEETS_WRITE_QUEUE.put_nowait({'range': f'Habits!B{row_number}', 'values': [[new_status]]})
+
+                # Keep the cached row in step with the queued write
+                for row in (HABITS_INDEX_CACHE['by_date'] or {}).get(date_str, []):
+                    if row[COL_EVENT_ID] == event_id:
+                        row[COL_STATUS] = new_status
+
+                # Cancel the reminder job if it exists
+                reminder_job_id = f"habit_check_{event_id}"
+                if scheduler.get_job(reminder_job_id):
+                    scheduler.remove_job(reminder_job_id)
+                    logger.info(f"Removed reminder job {reminder_job_id}")
+
+                # Send confirmation; a combined /habitcheck message keeps the other habits' buttons
+                emoji = "✅" if new_status == "Done" else "❌"
+                message = query.message
+                if message and message.text and message.text.startswith(COMBINED_CHECK_HEADER):
+                    keyboard = message.reply_markup.inline_keyboard if message.reply_markup else ()
+                    remaining = [row for row in keyboard if not row[0].callback_data.endswith(f"|{event_id}")]
+                    await query.edit_message_text(
+                        f"{message.text}\n{emoji} '{habit_description}' marked as {new_status}!",
+                        reply_markup=InlineKeyboardMarkup(remaining) if remaining else None
+                    )
+                else:
+                    await query.edit_message_text(
+                        f"{emoji} Habit '{habit_description}' marked as {new_status}!"
+                    )
+                logger.info(f"Updated habit status: {habit_description} -> {new_status}")
+            except Exception as e:
+                logger.error(f"Error updating habit status: {e}")
+                await query.edit_message_text("❌ An error occurred while updating the habit status.")
 
     except Exception as e:
         logger.error(f"Error handling habit response: {e}")
@@ -485,82 +802,72 @@ async def habit_check(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Manually trigger habit checks for today."""
     sheets_service = get_sheets_service()
     try:
-        result = sheets_service.spreadsheets().values().get(
-            spreadsheetId=SPREADSHEET_ID,
-            range='Habits!A:E'
-        ).execute()
-        values = result.get('values', [])
+        by_date = await load_habit_indices(sheets_service)
 
-        if not values or len(values) < 2:
+        if not by_date:
             await update.message.reply_text("No habits found to check.")
             return
 
-        headers = values[0]
-        habits = [dict(zip(headers, row)) for row in values[1:]]
-        today_str = datetime.now().strftime('%Y-%m-%d')
-        todays_habits = [habit for habit in habits if habit['Date'] == today_str and habit['Status'] == 'Pending']
+        today_str = datetime.now(LOCAL_TZ).strftime('%Y-%m-%d')
+        todays_habits = [row for row in by_date.get(today_str, []) if row[COL_STATUS] == 'Pending']
 
         if not todays_habits:
             await update.message.reply_text("All habits for today have been checked!")
             return
 
-        for habit in todays_habits:
-            await send_habit_check_directly(habit['Habit Description'], habit['Event ID'])
+        # One message per user with a button row per habit, instead of one message per habit
+        text = COMBINED_CHECK_HEADER + "\n" + "\n".join(
+            f"{number}. {row[COL_DESCRIPTION]}" for number, row in enumerate(todays_habits, start=1)
+        )
+        if broadcast_habit_check(text, kb_for_many(todays_habits)):
+            logger.info(f"Queued combined check for {len(todays_habits)} habit(s) to {len(USER_CHAT_IDS)} user(s)")
 
     except Exception as e:
         logger.error(f"Error in /habitcheck: {e}")
         await update.message.reply_text("An unexpected error occurred. Please try again later.")
 
-# Helper function to send habit check directly
-async def send_habit_check_directly(habit_description: str, event_id: str):
-    """Send a habit check message directly."""
-    if not USER_CHAT_IDS:
-        logger.error("No chat IDs available. Make sure users have sent /start first.")
-        return
-
-    for user_id in USER_CHAT_IDS.values():
-        keyboard = [
-            [
-                InlineKeyboardButton("✅ Yes", callback_data=f"habit_done|{event_id}"),
-                InlineKeyboardButton("❌ No", callback_data=f"habit_missed|{event_id}")
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
-        try:
-            await application.bot.send_message(
-                chat_id=user_id,
-                text=f"Did you complete the habit '{habit_description}' today?",
-                reply_markup=reply_markup
-            )
-            logger.info(f"Sent manual habit check for: {habit_description} to user {user_id}")
-        except Exception as e:
-            logger.error(f"Error sending manual habit check to user {user_id}: {e}")
-
 # Register all handlers
 def register_handlers(app: Application):
     # Command handlers
     app.add_handler(CommandHandler('start', start))
     app.add_handler(CommandHandler('help', help_command))
     app.add_handler(CommandHandler('sethabits', set_habits))
-    app.add_handler(CommandHandler('habitcheck', habit_check))
+    app.add_handler(CommandHandler('habitcheck', habit_check, block=False))
 
     # Callback query handlers
-    app.add_handler(CallbackQueryHandler(handle_habit_response, pattern='^habit_(done|missed)'))
+    app.add_handler(CallbackQueryHandler(handle_habit_done, pattern=lambda data: data.startswith(HABIT_DONE_PREFIX), block=False))
+    app.add_handler(CallbackQueryHandler(handle_habit_missed, pattern=lambda data: data.startswith(HABIT_MISSED_PREFIX), block=False))
 
     # Error handler
     app.add_error_handler(error_handler)
 
 if __name__ == '__main__':
     # Initialize the application
-    application = Application.builder().token(TOKEN).build()
+    application = (
+        Application.builder()
+        .token(TOKEN)
+        .concurrent_updates(True)
+        .rate_limiter(AIORateLimiter(overall_max_rate=30, overall_time_period=1, max_retries=3))
+        .post_init(start_background_tasks)
+        .post_shutdown(stop_background_tasks)
+        .build()
+    )
 
     # Register handlers
     register_handlers(application)
 
-    # Schedule habits two days ahead using APScheduler
-    schedule_habits_two_days_ahead(application)
+    # Schedule recurring habits using APScheduler
+    schedule_habits(application)
     logger.info("Habits scheduled successfully")
 
     logger.info("Starting the Habit Tracker Bot...")
-    application.run_polling()
+    if WEBHOOK_URL:
+        # Telegram pushes updates to us, so there is no getUpdates polling gap
+        application.run_webhook(
+            listen='0.0.0.0',
+            port=WEBHOOK_PORT,
+            secret_token=WEBHOOK_SECRET,
+            webhook_url=WEBHOOK_URL
+        )
+    else:
+        application.run_polling()
@@ -1,26 +1,31 @@
 # task_manager_bot.py
 
 import os
+import asyncio
 from dotenv import load_dotenv
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import RetryAfter
 from telegram.ext import (
+    AIORateLimiter,
     Application,
     CommandHandler,
     CallbackQueryHandler,
     ContextTypes,
-    ConversationHandler,
-    MessageHandler,
-    filters,
 )
 import dateparser
 from dateparser.search import search_dates
 from datetime import datetime, timedelta
 import pytz
 import re
+import time
+import uuid
+import hashlib
+from functools import lru_cache
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 from apscheduler.triggers.date import DateTrigger
-from config import get_sheets_service, SCOPES
+from config import get_sheets_service, execute_async, SCOPES, DATE_HINT_RE
 
 # Initialize application as None
 application = None
@@ -45,16 +50,63 @@ if not TOKEN:
 if not SPREADSHEET_ID:
     raise ValueError("No spreadsheet ID provided. Set the SPREADSHEET_ID environment variable.")
 
-# Initialize APScheduler
-scheduler = AsyncIOScheduler(timezone='Asia/Kuala_Lumpur')
-scheduler.start()
+# Local timezone, built once and shared by every handler
+LOCAL_TZ = pytz.timezone('Asia/Kuala_Lumpur')
 
-# Define states for ConversationHandler
-CONFIRMATION = 1
+# Initialize APScheduler; reminders are kept in SQLite so they survive restarts, and any
+# that came due while the bot was down still run (once each) when it starts again
+scheduler = AsyncIOScheduler(
+    jobstores={'default': SQLAlchemyJobStore(url='sqlite:///jobs.sqlite')},
+    job_defaults={'misfire_grace_time': None, 'coalesce': True},
+    timezone=LOCAL_TZ
+)
+scheduler.start()
 
-# Define accepted responses
-YES_RESPONSES = ['yes', 'yea', 'yep', 'yeah', 'sure', 'affirmative']
-NO_RESPONSES = ['no', 'nah', 'nope', 'negative']
+# Callback data prefixes for the /settask confirmation buttons
+CONFIRM_YES_PREFIX = 'confirm_yes|'
+CONFIRM_NO_PREFIX = 'confirm_no|'
+PENDING_TASK_TTL = 3600  # seconds a /settask confirmation stays answerable
+
+# The Sheets client is built once and shared by every handler
+@lru_cache(maxsize=1)
+def cached_sheets_service():
+    return get_sheets_service()
+
+# Column positions in the Tasks sheet
+COL_DESCRIPTION = 0
+COL_STATUS = 1
+COL_START_DATE = 2
+COL_DUE_DATE = 3
+
+# Tasks sheet values, reused for TASKS_CACHE_TTL seconds and invalidated after every write
+TASKS_CACHE_TTL = 30
+TASKS_CACHE = {'ts': 0.0, 'values': None}
+TASKS_CACHE_LOCK = asyncio.Lock()  # One sheet read at a time; concurrent callers share it
+
+# New task rows waiting to be appended, as (row, future); tasks_writer appends them in batches
+# and resolves each future with the row's sheet number
+TASKS_APPEND_QUEUE = asyncio.Queue()
+APPEND_BATCH_SIZE = 50
+APPEND_BATCH_WAIT = 0.2  # seconds to wait for more rows before appending
+UPDATED_RANGE_RE = re.compile(r'![A-Z]+(\d+)')
+tasks_writer_task = None
+
+# Patterns used to parse /settask input, compiled once
+DURATION_RE = re.compile(r'\b(?:for|last)\s+\d+\s+(?:hour|hours|hr|hrs|minute|minutes|min|m)\b', re.IGNORECASE)
+# Runs of whitespace and duration phrases, collapsed to one space in a single pass
+CLEANUP_RE = re.compile(rf'(?:\s|{DURATION_RE.pattern})+', re.IGNORECASE)
+STRUCTURED_TASK_RE = re.compile(r'^(.+?)\s*\|\s*(.+?)\s*$')
+DUE_DATE_FORMAT_RE = re.compile(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}')
+
+DATEPARSER_SETTINGS = {'PREFER_DATES_FROM': 'future'}
+
+# Common due-date shapes ("tomorrow at 7pm", "on friday", "at 10:30") parsed without dateparser
+FAST_DAY_RE = re.compile(
+    r'(?:\bon\s+)?\b(today|tomorrow|monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b',
+    re.IGNORECASE
+)
+FAST_TIME_RE = re.compile(r'(?:\bat\s+)?\b(\d{1,2})(?::(\d{2}))?\s*(am|pm)?\b', re.IGNORECASE)
+WEEKDAY_NAMES = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
 
 # Command: /start
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -82,38 +134,147 @@ async def error_handler(update, context):
     if update and update.effective_message:
         await update.effective_message.reply_text("An unexpected error occurred. Please try again later.")
 
+# Helper function to read the Tasks sheet through the cache
+async def get_tasks_cached(sheets_service, force=False):
+    """Return the Tasks sheet values, re-reading them once the cache is stale."""
+    requested_at = time.monotonic()
+    if not force and TASKS_CACHE['values'] is not None and requested_at - TASKS_CACHE['ts'] < TASKS_CACHE_TTL:
+        return TASKS_CACHE['values']
+
+    async with TASKS_CACHE_LOCK:
+        # Reuse a read that finished while we were waiting for the lock
+        if TASKS_CACHE['values'] is not None and TASKS_CACHE['ts'] >= requested_at:
+            return TASKS_CACHE['values']
+
+        result = await execute_async(sheets_service.spreadsheets().values().get(
+            spreadsheetId=SPREADSHEET_ID,
+            range='Tasks!A:D'
+        ))
+        TASKS_CACHE['ts'], TASKS_CACHE['values'] = time.monotonic(), result.get('values', [])
+        return TASKS_CACHE['values']
+
+# Helper function to append a batch of queued task rows
+async def flush_task_appends(batch):
+    """Append queued rows with one call and tell each waiting caller which row it landed on."""
+    try:
+        result = await execute_async(cached_sheets_service().spreadsheets().values().append(
+            spreadsheetId=SPREADSHEET_ID,
+            range='Tasks!A:D',
+            valueInputOption='RAW',
+            body={'values': [row for row, _ in batch]}
+        ))
+        TASKS_CACHE['ts'] = 0.0  # The cached sheet doesn't have the new rows yet
+        logger.info(f"Appended {len(batch)} task(s) to Google Sheets.")
+
+        match = UPDATED_RANGE_RE.search(result.get('updates', {}).get('updatedRange', ''))
+        first_row = int(match.group(1)) if match else None
+        for offset, (_, future) in enumerate(batch):
+            if not future.done():
+                future.set_result(first_row + offset if first_row else None)
+    except Exception as e:
+        logger.error(f"Error in flush_task_appends: {e}")
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(e)
+
+# Background task that drains the append queue
+async def tasks_writer():
+    """Collect queued rows for up to APPEND_BATCH_WAIT seconds and append them together."""
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await TASKS_APPEND_QUEUE.get()]
+        deadline = loop.time() + APPEND_BATCH_WAIT
+        while len(batch) < APPEND_BATCH_SIZE:
+            try:
+                batch.append(await asyncio.wait_for(TASKS_APPEND_QUEUE.get(), deadline - loop.time()))
+            except asyncio.TimeoutError:
+                break
+        await flush_task_appends(batch)
+
+# Application hooks that start the writer and append whatever is left on shutdown
+async def start_tasks_writer(app):
+    global tasks_writer_task
+    tasks_writer_task = asyncio.create_task(tasks_writer())
+
+async def stop_tasks_writer(app):
+    if tasks_writer_task:
+        tasks_writer_task.cancel()
+    batch = []
+    while not TASKS_APPEND_QUEUE.empty():
+        batch.append(TASKS_APPEND_QUEUE.get_nowait())
+    if batch:
+        await flush_task_appends(batch)
+
+# Helper function to parse the common due-date shapes directly
+def fast_parse_due_date(text, now):
+    """Return (text without the date words, naive due date), or None to fall back to dateparser."""
+    day_match = FAST_DAY_RE.search(text)
+    # A bare number could be anything, so a time needs minutes or am/pm
+    time_match = next((m for m in FAST_TIME_RE.finditer(text) if m.group(2) or m.group(3)), None)
+    if not (day_match or time_match):
+        return None
+
+    # Anything date-like left over (a second day, a month, "next") needs dateparser
+    rest = text
+    for match in sorted(filter(None, (day_match, time_match)), key=lambda m: m.start(), reverse=True):
+        rest = rest[:match.start()] + ' ' + rest[match.end():]
+    if DATE_HINT_RE.search(DURATION_RE.sub('', rest)):
+        return None
+
+    due_date = now.replace(tzinfo=None)
+    if day_match:
+        day = day_match.group(1).lower()
+        if day == 'tomorrow':
+            due_date += timedelta(days=1)
+        elif day != 'today':
+            # Weekdays mean the next one after today, at midnight unless a time is given
+            days_ahead = (WEEKDAY_NAMES.index(day) - now.weekday()) % 7 or 7
+            due_date = (due_date + timedelta(days=days_ahead)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    if time_match:
+        hour, minute, meridiem = int(time_match.group(1)), int(time_match.group(2) or 0), time_match.group(3)
+        if meridiem:
+            if not 1 <= hour <= 12:
+                return None
+            hour = hour % 12 + (12 if meridiem.lower() == 'pm' else 0)
+        if hour > 23 or minute > 59:
+            return None
+        due_date = due_date.replace(hour=hour, minute=minute, second=0, microsecond=0)
+
+    return rest, due_date
+
 # Function to parse natural language input for task details
 def parse_natural_language(text):
     ambiguous = False
-    local_tz = pytz.timezone('Asia/Kuala_Lumpur')
-    now = datetime.now(local_tz)
-    
-    # Extract due date using search_dates
-    date_times = search_dates(text, languages=['en'], settings={
-        'PREFER_DATES_FROM': 'future',
-        'RELATIVE_BASE': now
-    })
+    now = datetime.now(LOCAL_TZ)
+
+    # Common shapes are parsed directly; search_dates only runs if the text looks like a date
+    fast = fast_parse_due_date(text, now)
+    date_times = None
+    if not fast and DATE_HINT_RE.search(text):
+        date_times = search_dates(text, languages=['en'], settings={
+            **DATEPARSER_SETTINGS,
+            'RELATIVE_BASE': now
+        })
     logger.debug(f"Date times found: {date_times}")
 
-    if date_times:
+    if fast:
+        text, due_date = fast
+        logger.debug(f"Extracted due date without dateparser: {due_date}")
+    elif date_times:
         dt_text, due_date = date_times[0]
-        text = re.sub(re.escape(dt_text), '', text, flags=re.IGNORECASE)
+        # Remove the date/time text (case-insensitive literal match)
+        idx = text.lower().find(dt_text.lower())
+        if idx >= 0:
+            text = text[:idx] + text[idx + len(dt_text):]
         logger.debug(f"Extracted due date: {due_date}")
     else:
         due_date = now
         ambiguous = True
         logger.debug("No due date found; defaulting to current time and marking as ambiguous.")
 
-    # Remove duration phrases
-    duration_patterns = [
-        r'\bfor\s+\d+\s+(hour|hours|hr|hrs|minute|minutes|min|m)\b',
-        r'\blast\s+\d+\s+(hour|hours|hr|hrs|minute|minutes|min|m)\b'
-    ]
-    for pattern in duration_patterns:
-        text = re.sub(pattern, '', text, flags=re.IGNORECASE)
-        logger.debug(f"Removed duration pattern: {pattern}")
-
-    task_description = re.sub(r'\s+', ' ', text).strip().strip('.,')
+    # Drop duration phrases ("for 2 hours", "last 30 min") and squeeze whitespace in one pass
+    task_description = CLEANUP_RE.sub(' ', text).strip(' .,')
     logger.debug(f"Task description after cleanup: '{task_description}'")
 
     if not task_description or len(task_description.split()) < 2:
@@ -122,65 +283,110 @@ def parse_natural_language(text):
 
     return task_description, due_date, ambiguous
 
+# Run one throwaway parse so dateparser's English data is loaded before the first /settask
+def warm_up_dateparser():
+    search_dates('tomorrow at 10am', languages=['en'], settings=DATEPARSER_SETTINGS)
+
 # Function to create a task
 async def create_task(update, context, task_description, due_date):
-    local_tz = pytz.timezone('Asia/Kuala_Lumpur')
+    # Confirmed from a button press, so answer by editing the confirmation message
+    respond = update.callback_query.edit_message_text if update.callback_query else update.message.reply_text
     if due_date.tzinfo is None:
-        due_date = local_tz.localize(due_date)
+        due_date = LOCAL_TZ.localize(due_date)
     else:
-        due_date = due_date.astimezone(local_tz)
-    start_date = datetime.now(local_tz)
+        due_date = due_date.astimezone(LOCAL_TZ)
+    start_date = datetime.now(LOCAL_TZ)
+    due_str = due_date.strftime('%Y-%m-%d %H:%M')  # Formatted once for the sheet, job ID and reply
 
     try:
-        # Log the task in Google Sheets
-        sheets_service = get_sheets_service()
-        values = [[
+        # Log the task in Google Sheets; tasks_writer appends it together with any other new tasks
+        row = [
             task_description,                                      # Column A: Task Description
             'Pending',                                             # Column B: Status
             start_date.strftime('%Y-%m-%d %H:%M'),                # Column C: Start Date
-            due_date.strftime('%Y-%m-%d %H:%M')                   # Column D: Due Date
-        ]]
-
-        sheets_service.spreadsheets().values().append(
-            spreadsheetId=SPREADSHEET_ID,
-            range='Tasks!A:D',                                     # Updated range to include only necessary columns
-            valueInputOption='RAW',
-            body={'values': values}
-        ).execute()
+            due_str                                                # Column D: Due Date
+        ]
+        appended = asyncio.get_running_loop().create_future()
+        TASKS_APPEND_QUEUE.put_nowait((row, appended))
+        row_number = await appended
 
         # Schedule a reminder before the due date
         reminder_time = due_date - timedelta(minutes=30)  # 30 minutes before
         scheduler.add_job(
             send_task_reminder,
             trigger=DateTrigger(run_date=reminder_time),
-            args=[context.bot, update.effective_chat.id, task_description, due_date],
-            id=f"task_reminder_{task_description}_{due_date.strftime('%Y%m%d%H%M')}"
+            args=[update.effective_chat.id, task_description, due_date, row_number],
+            # Stored jobs are pickled, so the bot isn't passed in; the ID is a fixed-length hash
+            id="task_reminder_" + hashlib.sha1(
+                f"{update.effective_chat.id}|{task_description}|{due_str}".encode()
+            ).hexdigest(),
+            replace_existing=True
         )
 
         # Send confirmation
-        await update.message.reply_text(
-            f"✅ Task '{task_description}' has been added with a due date of {due_date.strftime('%Y-%m-%d %H:%M')}."
+        await respond(
+            f"✅ Task '{task_description}' has been added with a due date of {due_str}."
         )
 
     except Exception as e:
         logger.error(f"Error creating task: {e}")
-        await update.message.reply_text("❌ An error occurred while creating the task.")
+        await respond("❌ An error occurred while creating the task.")
+
+# Helper function to identify a task in callback data without its full text
+def task_fingerprint(task_description, due_str):
+    """Return a short hash of a task's description and due date."""
+    return hashlib.sha1(f"{task_description}|{due_str}".encode()).hexdigest()[:10]
+
+# Helper function to find the row holding a task, trying the row its reminder was sent with first
+async def find_task_row(sheets_service, row_number, fingerprint):
+    """Return the row number of the task with this fingerprint, or None if it is no longer in the sheet."""
+    result = await execute_async(sheets_service.spreadsheets().values().get(
+        spreadsheetId=SPREADSHEET_ID,
+        range=f'Tasks!A{row_number}:D{row_number}'
+    ))
+    rows = result.get('values', [])
+    if (rows and len(rows[0]) > COL_DUE_DATE and
+            task_fingerprint(rows[0][COL_DESCRIPTION], rows[0][COL_DUE_DATE]) == fingerprint):
+        return row_number
+
+    # The row has moved (sorted, inserted or deleted), so search the whole sheet
+    values = await get_tasks_cached(sheets_service, force=True)
+    for idx, row in enumerate(values[1:], start=2):
+        if len(row) > COL_DUE_DATE and task_fingerprint(row[COL_DESCRIPTION], row[COL_DUE_DATE]) == fingerprint:
+            return idx
+    return None
 
 # Function to send task reminder
-async def send_task_reminder(bot, chat_id, task_description, due_date):
+async def send_task_reminder(chat_id, task_description, due_date, row_number=None):
+    # The sheet row and a fingerprint of the task go in the callback data, so the response can check
+    # the row still holds this task; the description/due date form is only used if the append
+    # didn't report its row
+    due_str = due_date.strftime('%Y-%m-%d %H:%M')
+    if row_number:
+        key = f"{row_number}#{task_fingerprint(task_description, due_str)}"
+    else:
+        key = f"{task_description}|{due_str}"
     keyboard = [
         [
-            InlineKeyboardButton("✅ Completed", callback_data=f"task_done|{task_description}|{due_date.strftime('%Y-%m-%d %H:%M')}"),
-            InlineKeyboardButton("❌ Not Yet", callback_data=f"task_not_done|{task_description}|{due_date.strftime('%Y-%m-%d %H:%M')}")
+            InlineKeyboardButton("✅ Completed", callback_data=f"task_done|{key}"),
+            InlineKeyboardButton("❌ Not Yet", callback_data=f"task_not_done|{key}")
         ]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     try:
-        await bot.send_message(
+        await application.bot.send_message(
             chat_id=chat_id,
-            text=f"⏰ Reminder: Task '{task_description}' is due at {due_date.strftime('%H:%M')}. Have you completed it?",
+            text=f"⏰ Reminder: Task '{task_description}' is due at {due_str[11:]}. Have you completed it?",
             reply_markup=reply_markup
         )
+    except RetryAfter as e:
+        # Still flood-limited after the rate limiter's retries, so try again once Telegram allows it
+        logger.error(f"Flood limit sending task reminder, retrying in {e.retry_after}s: {e}")
+        scheduler.add_job(
+            send_task_reminder,
+            trigger=DateTrigger(run_date=datetime.now(LOCAL_TZ) + timedelta(seconds=e.retry_after)),
+            args=[chat_id, task_description, due_date, row_number]
+        )
     except Exception as e:
         logger.error(f"Error sending task reminder: {e}")
 
@@ -196,30 +402,29 @@ async def set_task(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "2. Structured format: /settask [Task Description] | [Due Date YYYY-MM-DD HH:MM]\n"
             "\nExample: /settask Finish report | 2024-10-25 17:00"
         )
-        return ConversationHandler.END
+        return
 
-    pattern = r'^(.+?)\s*\|\s*(.+?)\s*$'
-    match = re.match(pattern, command_removed, re.IGNORECASE)
+    match = STRUCTURED_TASK_RE.match(command_removed)
 
     try:
         if match:
             task_description = match.group(1).strip()
             due_date_str = match.group(2).strip()
             # Validate the due_date_str format (YYYY-MM-DD HH:MM)
-            if not re.match(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}', due_date_str):
+            if not DUE_DATE_FORMAT_RE.match(due_date_str):
                 await update.message.reply_text("❌ Please ensure the due date is in the format YYYY-MM-DD HH:MM.")
-                return ConversationHandler.END
+                return
 
-            due_date = dateparser.parse(due_date_str, settings={'PREFER_DATES_FROM': 'future'})
+            # The format is already known, so skip dateparser unless strptime can't handle it
+            try:
+                due_date = datetime.strptime(due_date_str, '%Y-%m-%d %H:%M')
+            except ValueError:
+                due_date = dateparser.parse(due_date_str, settings=DATEPARSER_SETTINGS)
 
             if not due_date:
                 await update.message.reply_text("❌ Could not parse the due date and time. Please ensure it's in a recognizable format.")
-                return ConversationHandler.END
+                return
 
-            context.user_data['pending_task'] = {
-                'description': task_description,
-                'due_date': due_date
-            }
         else:
             task_description, due_date, ambiguous = parse_natural_language(command_removed)
 
@@ -227,71 +432,110 @@ async def set_task(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 await update.message.reply_text(
                     "❓ I couldn't understand your request. Please provide a task description and a due date."
                 )
-                return ConversationHandler.END
+                return
 
             if ambiguous:
                 await update.message.reply_text(
                     "⚠️ Your input is ambiguous. Please provide more specific details about the task."
                 )
-                return ConversationHandler.END
-
-            context.user_data['pending_task'] = {
-                'description': task_description,
-                'due_date': due_date
-            }
-
+                return
+
+        # Keep the task until a confirmation button is pressed; the key ties the buttons to it.
+        # Confirmations nobody answered within PENDING_TASK_TTL are dropped here so they don't pile up
+        key = uuid.uuid4().hex[:8]
+        pending_tasks = context.user_data.setdefault('pending_tasks', {})
+        created = time.monotonic()
+        for stale_key in [k for k, task in pending_tasks.items() if created - task['created'] > PENDING_TASK_TTL]:
+            del pending_tasks[stale_key]
+        pending_tasks[key] = {
+            'description': task_description,
+            'due_date': due_date,
+            'created': created
+        }
+        reply_markup = InlineKeyboardMarkup([
+            [
+                InlineKeyboardButton("✅ Yes", callback_data=f"{CONFIRM_YES_PREFIX}{key}"),
+                InlineKeyboardButton("❌ No", callback_data=f"{CONFIRM_NO_PREFIX}{key}")
+            ]
+        ])
         await update.message.reply_text(
             f"Please confirm the task details:\n"
-            f"📝 Description: {context.user_data['pending_task']['description']}\n"
-            f"📅 Due Date: {context.user_data['pending_task']['due_date'].strftime('%Y-%m-%d %H:%M')}\n"
-            f"\nReply with 'yes' to confirm or 'no' to cancel."
+            f"📝 Description: {task_description}\n"
+            f"📅 Due Date: {due_date.strftime('%Y-%m-%d %H:%M')}",
+            reply_markup=reply_markup
         )
-        return CONFIRMATION
 
     except Exception as e:
         logger.error(f"Error in set_task: {e}")
         await update.message.reply_text("❌ An error occurred while processing your request. Please try again.")
-        return ConversationHandler.END
 
-# Handler for confirmation
+# Callback handler for the /settask confirmation buttons
 async def handle_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
     try:
-        user_response = update.message.text.strip().lower()
-
-        if user_response in YES_RESPONSES:
-            task_description = context.user_data['pending_task']['description']
-            due_date = context.user_data['pending_task']['due_date']
-            await create_task(update, context, task_description, due_date)
-        elif user_response in NO_RESPONSES:
-            await update.message.reply_text("🛑 Task creation cancelled.")
+        confirmed = query.data.startswith(CONFIRM_YES_PREFIX)
+        key = query.data.partition('|')[2]
+        pending_task = context.user_data.get('pending_tasks', {}).pop(key, None)
+
+        if not pending_task or time.monotonic() - pending_task['created'] > PENDING_TASK_TTL:
+            await query.edit_message_text("⚠️ This task was already handled or has expired. Use /settask to add a new one.")
+        elif confirmed:
+            await create_task(update, context, pending_task['description'], pending_task['due_date'])
         else:
-            await update.message.reply_text("❓ Invalid response. Please reply with 'yes' or 'no'.")
-            return CONFIRMATION
-        return ConversationHandler.END
+            await query.edit_message_text("🛑 Task creation cancelled.")
     except Exception as e:
         logger.error(f"Error handling confirmation: {e}")
-        await update.message.reply_text("❌ An error occurred while handling the confirmation. Please try again.")
-        return ConversationHandler.END
+        await query.edit_message_text("❌ An error occurred while handling the confirmation. Please try again.")
 
 # Callback handler for task completion
 async def handle_task_response(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     data = query.data.split('|')
+    new_status = 'Done' if data[0] == "task_done" else 'Pending'
+    emoji = "✅" if data[0] == "task_done" else "⏳"
+
+    # Current reminders carry the sheet row and task fingerprint; the row is checked before writing
+    if len(data) == 2 and '#' in data[1]:
+        row_str, _, fingerprint = data[1].partition('#')
+        sheets_service = cached_sheets_service()
+        try:
+            row_number = await find_task_row(sheets_service, int(row_str), fingerprint)
+        except Exception as e:
+            logger.error(f"Error fetching data from Google Sheets: {e}")
+            await query.edit_message_text("❌ An error occurred while accessing the task list.")
+            return
+
+        if not row_number:
+            await query.edit_message_text("❌ Task not found in the sheet.")
+            return
+
+        try:
+            await execute_async(sheets_service.spreadsheets().values().update(
+                spreadsheetId=SPREADSHEET_ID,
+                range=f'Tasks!B{row_number}',
+                valueInputOption='RAW',
+                body={'values': [[new_status]]}
+            ))
+            TASKS_CACHE['ts'] = 0.0
+            await query.edit_message_text(f"{query.message.text}\n\n{emoji} Marked as {new_status}!")
+        except Exception as e:
+            logger.error(f"Error updating task status: {e}")
+            await query.edit_message_text("❌ An error occurred while updating the task status.")
+        return
+
     if len(data) != 3:
         await query.edit_message_text("❌ Invalid response.")
         return
 
-    status, task_description, due_date_str = data
-    sheets_service = get_sheets_service()
+    # Older reminders carry the description and due date, so the row has to be looked up
+    _, task_description, due_date_str = data
+    sheets_service = cached_sheets_service()
 
     # Read current data
     try:
-        result = sheets_service.spreadsheets().values().get(
-            spreadsheetId=SPREADSHEET_ID,
-            range='Tasks!A:D'
-        ).execute()
-        values = result.get('values', [])
+        values = await get_tasks_cached(sheets_service)
     except Exception as e:
         logger.error(f"Error fetching data from Google Sheets: {e}")
         await query.edit_message_text("❌ An error occurred while accessing the task list.")
@@ -301,16 +545,12 @@ async def handle_task_response(update: Update, context: ContextTypes.DEFAULT_TYP
         await query.edit_message_text("❌ No tasks found in the sheet.")
         return
 
-    # Process sheet data
-    headers = values[0]
-    tasks = [dict(zip(headers, row)) for row in values[1:]]
-    logger.debug(f"Tasks fetched: {tasks}")
-
-    # Find the task
+    # Find the task by position; rows missing a due date can't match
     row_number = None
-    for idx, record in enumerate(tasks, start=2):
-        if (record.get('Task Description', '').lower() == task_description.lower() and
-                record.get('Due Date', '') == due_date_str):
+    target_description = task_description.lower()
+    for idx, row in enumerate(values[1:], start=2):
+        if (len(row) > COL_DUE_DATE and row[COL_DUE_DATE] == due_date_str and
+                row[COL_DESCRIPTION].lower() == target_description):
             row_number = idx
             break
 
@@ -319,17 +559,16 @@ async def handle_task_response(update: Update, context: ContextTypes.DEFAULT_TYP
         return
 
     # Update status
-    new_status = 'Done' if status == "task_done" else 'Pending'
     try:
-        sheets_service.spreadsheets().values().update(
+        await execute_async(sheets_service.spreadsheets().values().update(
             spreadsheetId=SPREADSHEET_ID,
             range=f'Tasks!B{row_number}',
             valueInputOption='RAW',
             body={'values': [[new_status]]}
-        ).execute()
+        ))
+        TASKS_CACHE['ts'] = 0.0
 
         # Send confirmation
-        emoji = "✅" if status == "task_done" else "⏳"
         await query.edit_message_text(
             f"{emoji} Task '{task_description}' marked as {new_status}!"
         )
@@ -340,51 +579,34 @@ async def handle_task_response(update: Update, context: ContextTypes.DEFAULT_TYP
 # Command: /tasktoday
 async def task_today(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """View today's tasks."""
-    sheets_service = get_sheets_service()
+    sheets_service = cached_sheets_service()
     try:
-        result = sheets_service.spreadsheets().values().get(
-            spreadsheetId=SPREADSHEET_ID,
-            range='Tasks!A:D'
-        ).execute()
-        values = result.get('values', [])
+        values = await get_tasks_cached(sheets_service)
 
         if not values or len(values) < 2:
             await update.message.reply_text("🎉 You have no tasks for today! Great job!")
             return
 
-        headers = values[0]
-        tasks = [dict(zip(headers, row)) for row in values[1:]]
-        logger.debug(f"Tasks fetched: {tasks}")
-
-        local_tz = pytz.timezone('Asia/Kuala_Lumpur')
-        now = datetime.now(local_tz)
-        today_str = now.strftime('%Y-%m-%d')
+        today_str = datetime.now(LOCAL_TZ).strftime('%Y-%m-%d')
         logger.debug(f"Today's date: {today_str}")
 
-        todays_tasks = []
-        for task in tasks:
-            due_date_str = task.get('Due Date', '')
-            if not due_date_str:
-                continue
-            try:
-                due_date = datetime.strptime(due_date_str, '%Y-%m-%d %H:%M')
-                due_date = local_tz.localize(due_date)
-            except ValueError as ve:
-                logger.error(f"Error parsing due date '{due_date_str}': {ve}")
-                continue
-            if due_date.strftime('%Y-%m-%d') == today_str and task.get('Status', '').lower() != 'done':
-                todays_tasks.append(task)
+        # Due dates are stored as local 'YYYY-MM-DD HH:MM' text, so the date prefix is enough
+        todays_tasks = [
+            row for row in values[1:]
+            if len(row) > COL_DUE_DATE and row[COL_DUE_DATE].startswith(today_str)
+            and row[COL_STATUS].lower() != 'done'
+        ]
 
         if not todays_tasks:
             await update.message.reply_text("🎉 You have no tasks for today! Great job!")
             return
 
         # Sort tasks by due time
-        todays_tasks.sort(key=lambda x: x['Due Date'])
+        todays_tasks.sort(key=lambda row: row[COL_DUE_DATE])
 
         message = "📝 **Today's Tasks:**\n"
-        for idx, task in enumerate(todays_tasks, start=1):
-            message += f"{idx}. {task.get('Task Description', 'No Description')} (Due: {task.get('Due Date', 'No Due Date')})\n"
+        for idx, row in enumerate(todays_tasks, start=1):
+            message += f"{idx}. {row[COL_DESCRIPTION] or 'No Description'} (Due: {row[COL_DUE_DATE]})\n"
 
         await update.message.reply_text(message)
 
@@ -399,19 +621,10 @@ def register_handlers(app):
     app.add_handler(CommandHandler('help', help_command))
     app.add_handler(CommandHandler('tasktoday', task_today))
 
-    # Conversation handler for /settask
-    conv_handler = ConversationHandler(
-        entry_points=[CommandHandler('settask', set_task)],
-        states={
-            CONFIRMATION: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_confirmation)],
-        },
-        fallbacks=[CommandHandler('cancel', lambda u, c: ConversationHandler.END)],
-        name="task_conversation",
-        persistent=False
-    )
-    app.add_handler(conv_handler)
+    app.add_handler(CommandHandler('settask', set_task))
 
     # Callback query handlers
+    app.add_handler(CallbackQueryHandler(handle_confirmation, pattern='^confirm_'))
     app.add_handler(CallbackQueryHandler(handle_task_response, pattern='^task_'))
 
     # Error handler
@@ -419,10 +632,19 @@ def register_handlers(app):
 
 if __name__ == '__main__':
     # Initialize the application
-    application = Application.builder().token(TOKEN).build()
+    application = (
+        Application.builder()
+        .token(TOKEN)
+        .concurrent_updates(32)  # A slow Sheets call in one chat no longer holds up the others
+        .rate_limiter(AIORateLimiter(overall_max_rate=28, max_retries=3))
+        .post_init(start_tasks_writer)
+        .post_shutdown(stop_tasks_writer)
+        .build()
+    )
 
     # Register handlers
     register_handlers(application)
+    warm_up_dateparser()
 
     logger.info("Starting the Task Manager Bot...")
     application.run_polling()